@@ -0,0 +1,155 @@
+from dataclasses import dataclass
+
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup
+
+from keyboards import menu
+
+
+# Telegram не принимает callback_data длиннее 64 байт
+MAX_CALLBACK_DATA = 64
+
+
+@dataclass(frozen=True, slots=True)
+class Option:
+    code: str
+    title: str
+    value: object
+    # Подтверждение для пользователя; None - молча
+    done: str | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class Actuator:
+    # name - в callback_data выбора элемента (el_<name>), prefix - в кнопках значений (<prefix>_<code>)
+    name: str
+    prefix: str
+    key: str
+    title: str
+    prompt: str
+    options: tuple[Option, ...]
+    # Подтверждение показывается и в самом сообщении, а не только всплывающим уведомлением
+    announce: bool = False
+
+
+@dataclass(frozen=True, slots=True)
+class Action:
+    # elements - список элементов, cancel - назад в меню ручного режима,
+    # choose - значения элемента, set - выставить значение
+    kind: str
+    actuator: Actuator | None = None
+    option: Option | None = None
+
+
+# ---------- Реестр исполнительных элементов ----------
+# Элемент описывается один раз: ключ контроллера, кнопки и подтверждения. По
+# описанию заранее собираются клавиатуры и таблица callback_data -> действие,
+# так что любое нажатие в ручном режиме разбирается одним поиском в словаре,
+# сколько бы элементов ни было.
+class ActuatorRegistry:
+    def __init__(self, *actuators: Actuator, elements: str = "set_element_manual", cancel: str = "el_cancel"):
+        self.cancel = cancel
+        self.actuators: dict[str, Actuator] = {}
+        self.actions: dict[str, Action] = {elements: Action("elements"), cancel: Action("cancel")}
+        self._keyboards: dict[str, InlineKeyboardMarkup] = {}
+        self._elements_kb: InlineKeyboardMarkup | None = None
+        for actuator in actuators:
+            self.add(actuator)
+
+    def add(self, actuator: Actuator) -> Actuator:
+        actions = {f"el_{actuator.name}": Action("choose", actuator)}
+        for option in actuator.options:
+            actions[f"{actuator.prefix}_{option.code}"] = Action("set", actuator, option)
+        actions[f"{actuator.prefix}_back"] = Action("elements")
+
+        taken = sorted(self.actions.keys() & actions.keys())
+        if taken:
+            raise ValueError(f"callback_data уже занят: {', '.join(taken)}")
+        too_long = [data for data in actions if len(data.encode()) > MAX_CALLBACK_DATA]
+        if too_long:
+            raise ValueError(f"callback_data длиннее {MAX_CALLBACK_DATA} байт: {', '.join(too_long)}")
+
+        self.actions.update(actions)
+        self.actuators[actuator.name] = actuator
+        self._keyboards[actuator.name] = menu(
+            *((option.title, f"{actuator.prefix}_{option.code}") for option in actuator.options),
+            ("Назад", f"{actuator.prefix}_back"),
+        )
+        self._elements_kb = None
+        return actuator
+
+    # ---------- Клавиатуры ----------
+    def keyboard(self, actuator: Actuator) -> InlineKeyboardMarkup:
+        return self._keyboards[actuator.name]
+
+    @property
+    def elements_kb(self) -> InlineKeyboardMarkup:
+        if self._elements_kb is None:
+            self._elements_kb = menu(
+                *((actuator.title, f"el_{actuator.name}") for actuator in self.actuators.values()),
+                ("Отмена", self.cancel),
+            )
+        return self._elements_kb
+
+    # ---------- Разбор нажатий ----------
+    def resolve(self, data: str | None) -> Action | None:
+        return self.actions.get(data)
+
+    def match(self, callback: CallbackQuery) -> dict | bool:
+        # Фильтр aiogram: найденное действие передаётся хендлеру аргументом action
+        action = self.actions.get(callback.data)
+        return {"action": action} if action is not None else False
+
+
+LED = Actuator(
+    name="led",
+    prefix="led",
+    key="led_color",
+    title="Свет (LED)",
+    prompt="Выберите цвет LED:",
+    options=(
+        Option("red", "Красный", "red", "LED установлен: red"),
+        Option("green", "Зеленый", "green", "LED установлен: green"),
+        Option("blue", "Синий", "blue", "LED установлен: blue"),
+        Option("yellow", "Жёлтый", "yellow", "LED установлен: yellow"),
+        Option("off", "Выключить", "None", "LED выключен"),
+    ),
+)
+
+WINDOW = Actuator(
+    name="window",
+    prefix="win",
+    key="window_open",
+    title="Окно (серво)",
+    prompt="Управление окном:",
+    options=(
+        Option("open", "Открыть", True),
+        Option("close", "Закрыть", False),
+    ),
+)
+
+BUZZER = Actuator(
+    name="buzzer",
+    prefix="buzz",
+    key="buzzer_active",
+    title="Пищалка",
+    prompt="Управление пищалкой:",
+    options=(
+        Option("on", "Включить", True),
+        Option("off", "Выключить", False),
+    ),
+)
+
+ALARM = Actuator(
+    name="alarm",
+    prefix="alarm",
+    key="alarm_active",
+    title="Сигнализация",
+    prompt="Управление сигнализацией:",
+    options=(
+        Option("on", "Включить", True, "Сигнализация включена"),
+        Option("off", "Выключить", False, "Сигнализация выключена"),
+    ),
+    announce=True,
+)
+
+CONTROLS = ActuatorRegistry(LED, WINDOW, BUZZER, ALARM)
@@ -0,0 +1,98 @@
+import csv
+import math
+import sys
+
+
+# ---------- Детектор роста уровня газа ----------
+# Каждое показание MQ2 обновляет экспоненциальные среднее, дисперсию и скорость
+# изменения за O(1) и без хранения истории. Предупреждение поднимается, если
+# показание выбивается из обычного уровня больше чем на z_threshold сигм
+# ("zscore") или уровень устойчиво растёт быстрее rate_threshold единиц в
+# минуту ("trend"). Первые warmup показаний только обучают детектор, после
+# предупреждения следующее возможно не раньше чем через cooldown секунд.
+class GasAnomalyDetector:
+    __slots__ = (
+        "alpha", "rate_alpha", "z_threshold", "rate_threshold", "min_std", "warmup", "cooldown",
+        "mean", "var", "rate", "samples", "last_ts", "last_value", "alert_ts",
+    )
+
+    def __init__(
+        self,
+        *,
+        alpha: float = 0.1,
+        rate_alpha: float = 0.3,
+        z_threshold: float = 4,
+        rate_threshold: float = 30,
+        min_std: float = 2,
+        warmup: int = 10,
+        cooldown: float = 600,
+    ):
+        self.alpha = alpha
+        self.rate_alpha = rate_alpha
+        self.z_threshold = z_threshold
+        self.rate_threshold = rate_threshold
+        self.min_std = min_std
+        self.warmup = warmup
+        self.cooldown = cooldown
+        self.mean = 0.0
+        self.var = 0.0
+        self.rate = 0.0
+        self.samples = 0
+        self.last_ts = 0.0
+        self.last_value = 0.0
+        self.alert_ts = -math.inf
+
+    def zscore(self, value: float) -> float:
+        return (value - self.mean) / max(math.sqrt(self.var), self.min_std)
+
+    def update(self, ts: float, value: float) -> str | None:
+        if self.samples == 0:
+            self.mean = value
+            self.last_ts, self.last_value = ts, value
+            self.samples = 1
+            return None
+
+        # z считается по статистике до этого показания, иначе выброс гасит сам себя
+        z = self.zscore(value)
+        dt = ts - self.last_ts
+        if dt > 0:
+            slope = (value - self.last_value) * 60 / dt
+            self.rate += self.rate_alpha * (slope - self.rate)
+
+        diff = value - self.mean
+        increment = self.alpha * diff
+        self.mean += increment
+        self.var = (1 - self.alpha) * (self.var + diff * increment)
+        self.last_ts, self.last_value = ts, value
+        self.samples += 1
+
+        if self.samples <= self.warmup or ts - self.alert_ts < self.cooldown:
+            return None
+        if z >= self.z_threshold:
+            reason = "zscore"
+        elif self.rate >= self.rate_threshold:
+            reason = "trend"
+        else:
+            return None
+        self.alert_ts = ts
+        return reason
+
+
+# ---------- Прогон по записанным показаниям ----------
+def replay(samples, **options) -> list[tuple[float, float, str]]:
+    # samples - пары (время, значение); возвращает сработавшие предупреждения
+    detector = GasAnomalyDetector(**options)
+    alerts = []
+    for ts, value in samples:
+        reason = detector.update(ts, value)
+        if reason is not None:
+            alerts.append((ts, value, reason))
+    return alerts
+
+
+if __name__ == "__main__":
+    # python anomaly.py samples.csv  - файл со строками "время,значение"
+    with open(sys.argv[1], newline="") as f:
+        rows = [(float(ts), float(value)) for ts, value in csv.reader(f)]
+    for ts, value, reason in replay(rows):
+        print(f"{ts:.0f}\t{value:g}\t{reason}")
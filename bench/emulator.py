@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+from collections import Counter
+
+from aiohttp import web
+
+
+logger = logging.getLogger(__name__)
+
+# Начальное состояние - те же ключи, что читает и пишет бот
+INITIAL_STATE = {
+    "inside_presence": False,
+    "pir_motion": False,
+    "last_ldr": 600,
+    "last_mq2": 120,
+    "last_temp": 15,
+    "last_hum": 60,
+    "led_color": "None",
+    "window_open": False,
+    "buzzer_active": False,
+    "alarm_active": False,
+    "control_mode": "auto",
+    "alarm_code": "1234",
+    "event": "None",
+}
+
+EVENTS = ("Gas, open", "Gas, close", "Illegal access", "Moving near", "Light_on", "Light_off")
+
+
+# ---------- Эмулятор контроллера ----------
+# Локальная замена удалённому контроллеру: /get/<key>, /set/<key>, /get/state,
+# /set/batch и поток событий /subscribe/event (SSE). Каждому ответу добавляется
+# задержка latency ± jitter, а с вероятностью error_rate он заканчивается 503.
+# bulk=False и push=False выключают пакетные эндпоинты и SSE, чтобы проверить
+# запасные пути бота.
+class ControllerEmulator:
+    def __init__(
+        self,
+        *,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        bulk: bool = True,
+        push: bool = True,
+        seed: int | None = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.bulk = bulk
+        self.push = push
+        self.random = random.Random(seed)
+        self.state = dict(INITIAL_STATE)
+        self.hits: Counter[str] = Counter()
+        self._seq = 0
+        self._subscribers: set[asyncio.Queue] = set()
+        self._runner: web.AppRunner | None = None
+        self._generators: list[asyncio.Task] = []
+
+    @property
+    def requests(self) -> int:
+        return sum(self.hits.values())
+
+    # ---------- HTTP ----------
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/get/state", self._get_state)
+        app.router.add_post("/set/batch", self._set_batch)
+        app.router.add_get("/subscribe/event", self._subscribe)
+        app.router.add_get("/get/{key}", self._get)
+        app.router.add_post("/set/{key}", self._set)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        # При port=0 порт выбирает система
+        port = self._runner.addresses[0][1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        for task in self._generators:
+            task.cancel()
+        await asyncio.gather(*self._generators, return_exceptions=True)
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _delay(self) -> bool:
+        # False - запрос должен завершиться ошибкой
+        pause = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        if pause > 0:
+            await asyncio.sleep(pause)
+        return self.random.random() >= self.error_rate
+
+    async def _get(self, request: web.Request) -> web.Response:
+        key = request.match_info["key"]
+        self.hits[f"get/{key}"] += 1
+        if not await self._delay():
+            return web.json_response({"error": "unavailable"}, status=503)
+        if key not in self.state:
+            return web.json_response({"error": "unknown key"}, status=404)
+        return web.json_response({"value": self.state[key]})
+
+    async def _set(self, request: web.Request) -> web.Response:
+        key = request.match_info["key"]
+        self.hits[f"set/{key}"] += 1
+        if not await self._delay():
+            return web.json_response({"error": "unavailable"}, status=503)
+        payload = await request.json()
+        if key not in self.state or key not in payload:
+            return web.json_response({"error": "unknown key"}, status=404)
+        self.state[key] = payload[key]
+        return web.json_response({"ok": True})
+
+    async def _get_state(self, request: web.Request) -> web.Response:
+        self.hits["get/state"] += 1
+        if not self.bulk:
+            return web.json_response({"error": "not found"}, status=404)
+        if not await self._delay():
+            return web.json_response({"error": "unavailable"}, status=503)
+        return web.json_response({"value": {k: v for k, v in self.state.items() if k != "alarm_code"}})
+
+    async def _set_batch(self, request: web.Request) -> web.Response:
+        self.hits["set/batch"] += 1
+        if not self.bulk:
+            return web.json_response({"error": "not found"}, status=404)
+        if not await self._delay():
+            return web.json_response({"error": "unavailable"}, status=503)
+        payload = await request.json()
+        self.state.update({k: v for k, v in payload.items() if k in self.state})
+        return web.json_response({"ok": True})
+
+    async def _subscribe(self, request: web.Request) -> web.StreamResponse:
+        self.hits["subscribe/event"] += 1
+        if not self.push:
+            return web.json_response({"error": "not found"}, status=404)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.add(queue)
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), 15)
+                except asyncio.TimeoutError:
+                    await response.write(b": keepalive\n\n")
+                    continue
+                if item is None:
+                    break
+                seq, value = item
+                await response.write(f"id: {seq}\ndata: {json.dumps({'value': value, 'seq': seq})}\n\n".encode())
+        except ConnectionResetError:
+            pass
+        finally:
+            self._subscribers.discard(queue)
+        return response
+
+    # ---------- Генераторы ----------
+    def emit(self, value: str):
+        # Событие видно и через /get/event, и подписчикам SSE
+        self._seq += 1
+        self.state["event"] = value
+        for queue in self._subscribers:
+            queue.put_nowait((self._seq, value))
+
+    def step_sensors(self):
+        # Случайное блуждание показаний в правдоподобных пределах
+        state, rnd = self.state, self.random
+        state["last_temp"] = max(-30, min(40, state["last_temp"] + rnd.choice((-1, 0, 0, 1))))
+        state["last_hum"] = max(10, min(100, state["last_hum"] + rnd.choice((-2, 0, 0, 2))))
+        state["last_mq2"] = max(50, min(1000, state["last_mq2"] + rnd.randint(-3, 3)))
+        state["last_ldr"] = max(0, min(1023, state["last_ldr"] + rnd.randint(-10, 10)))
+        state["pir_motion"] = rnd.random() < 0.05
+        if rnd.random() < 0.01:
+            state["inside_presence"] = not state["inside_presence"]
+
+    def run_generators(self, *, sensor_interval: float = 1, event_interval: float | None = None):
+        async def sensors():
+            while True:
+                self.step_sensors()
+                await asyncio.sleep(sensor_interval)
+
+        async def events():
+            while True:
+                await asyncio.sleep(self.random.expovariate(1 / event_interval))
+                self.emit(self.random.choice(EVENTS))
+
+        self._generators.append(asyncio.create_task(sensors()))
+        if event_interval:
+            self._generators.append(asyncio.create_task(events()))
+
+
+# ---------- Запуск отдельно: python bench/emulator.py --port 8765 ----------
+async def serve_forever(args: argparse.Namespace):
+    emulator = ControllerEmulator(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        bulk=not args.no_bulk,
+        push=not args.no_push,
+        seed=args.seed,
+    )
+    url = await emulator.start(args.host, args.port)
+    emulator.run_generators(sensor_interval=args.sensor_interval, event_interval=args.event_interval)
+    logger.info(f"[EMULATOR] Контроллер на {url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await emulator.stop()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Эмулятор контроллера умного дома")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--no-bulk", action="store_true", help="без /get/state и /set/batch")
+    parser.add_argument("--no-push", action="store_true", help="без /subscribe/event")
+    parser.add_argument("--sensor-interval", type=float, default=1)
+    parser.add_argument("--event-interval", type=float, default=30, help="среднее время между событиями, 0 - без событий")
+    parser.add_argument("--seed", type=int)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    try:
+        asyncio.run(serve_forever(parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,123 @@
+import asyncio
+import datetime
+import importlib
+import itertools
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import EditMessageText, SendMessage, TelegramMethod
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+
+USER = User(id=1, is_bot=False, first_name="bench")
+
+# ---------- Сессия Telegram без сети ----------
+# Вместо запросов к Bot API запоминает момент каждого sendMessage и будит тех,
+# кто ждёт сообщение в конкретный чат. Правки сообщений только считаются.
+class RecordingSession(BaseSession):
+    def __init__(self):
+        super().__init__()
+        self.sent = 0
+        self.edited = 0
+        self._waiters: dict[int, list[tuple[str | None, asyncio.Future]]] = {}
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method: TelegramMethod, timeout: int | None = None):
+        if isinstance(method, SendMessage):
+            self.sent += 1
+            now = time.perf_counter()
+            for waiter in self._waiters.pop(method.chat_id, []):
+                contains, future = waiter
+                if contains is None or contains in method.text:
+                    if not future.done():
+                        future.set_result(now)
+                else:
+                    self._waiters.setdefault(method.chat_id, []).append(waiter)
+            return Message(
+                message_id=next(self._message_ids),
+                date=datetime.datetime.now(),
+                chat=Chat(id=method.chat_id, type="private"),
+                text=method.text,
+            )
+        if isinstance(method, EditMessageText):
+            self.edited += 1
+        return True
+
+    def wait_for(self, chat_id: int, contains: str | None = None) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(chat_id, []).append((contains, future))
+        return future
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+_update_ids = itertools.count(1)
+
+
+def text_update(chat_id: int, text: str) -> Update:
+    update_id = next(_update_ids)
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id,
+        date=datetime.datetime.now(),
+        chat=Chat(id=chat_id, type="private"),
+        from_user=USER,
+        text=text,
+    ))
+
+
+def summarize(samples: list[float]) -> dict:
+    # Секунды -> миллисекунды
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": pick(0.5),
+        "p90_ms": pick(0.9),
+        "p99_ms": pick(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def callback_update(chat_id: int, data: str) -> Update:
+    update_id = next(_update_ids)
+    message = Message(
+        message_id=update_id,
+        date=datetime.datetime.now(),
+        chat=Chat(id=chat_id, type="private"),
+        text="menu",
+    )
+    return Update(update_id=update_id, callback_query=CallbackQuery(
+        id=str(update_id),
+        from_user=USER,
+        chat_instance=str(chat_id),
+        message=message,
+        data=data,
+    ))
+
+
+def load_bot(controller_url: str):
+    # Базы и журнал бота - во временном каталоге, чтобы не трогать рабочие
+    os.environ.setdefault("BOT_TOKEN", "42:BENCHMARK")
+    os.chdir(tempfile.mkdtemp(prefix="bot-bench-"))
+    bot_main = importlib.import_module("main")
+    logging.getLogger().setLevel(logging.WARNING)
+    bot_main.SERVER_URL = controller_url
+    session = RecordingSession()
+    bot_main.bot.session = session
+    return bot_main, session
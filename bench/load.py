@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+import datetime
+import gc
+import json
+import logging
+import platform
+import time
+import tracemalloc
+from pathlib import Path
+
+from emulator import ControllerEmulator
+from harness import ROOT, callback_update, load_bot, summarize, text_update
+
+
+logger = logging.getLogger("bench")
+
+# Один проход виртуального пользователя: главное меню, опрос, смена режима с
+# вводом кода, ручное управление через FSM и смена кода сигнализации.
+SCENARIO = (
+    ("text", "/start"),
+    ("text", "/state"),
+    ("callback", "menu_state"),
+    ("callback", "menu_mode"),
+    ("text", "1234"),
+    ("callback", "set_element_manual"),
+    ("callback", "el_led"),
+    ("callback", "led_red"),
+    ("callback", "set_element_manual"),
+    ("callback", "el_window"),
+    ("callback", "win_open"),
+    ("callback", "check_state_manual"),
+    ("callback", "exit_manual"),
+    ("text", "/code"),
+    ("text", "1234"),
+)
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors = 0
+        self.updates = 0
+
+    def record(self, step: str, elapsed: float):
+        self.latencies.setdefault(step, []).append(elapsed)
+        self.updates += 1
+
+    def all_latencies(self) -> list[float]:
+        return [value for values in self.latencies.values() for value in values]
+
+
+async def virtual_user(bot_main, chat_id: int, stats: LoadStats, deadline: float, rounds: int):
+    done = 0
+    while done < rounds or time.monotonic() < deadline:
+        for kind, payload in SCENARIO:
+            update = text_update(chat_id, payload) if kind == "text" else callback_update(chat_id, payload)
+            started = time.perf_counter()
+            try:
+                await bot_main.dp.feed_update(bot_main.bot, update)
+            except Exception:
+                stats.errors += 1
+                logger.exception(f"Ошибка на шаге {payload}")
+            stats.record(f"{kind}:{payload}", time.perf_counter() - started)
+        done += 1
+        if time.monotonic() >= deadline and done >= rounds:
+            break
+
+
+def memory_top(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, limit: int = 10) -> list[dict]:
+    # Строки, на которых память выросла сильнее всего
+    stats = after.compare_to(before, "lineno")
+    top = []
+    for stat in stats:
+        frame = stat.traceback[0]
+        if stat.size_diff <= 0:
+            continue
+        top.append({"where": f"{frame.filename}:{frame.lineno}", "size_diff_kb": stat.size_diff / 1024, "count_diff": stat.count_diff})
+        if len(top) >= limit:
+            break
+    return top
+
+
+async def run(args: argparse.Namespace) -> dict:
+    emulator = ControllerEmulator(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=args.seed)
+    url = await emulator.start()
+    emulator.run_generators(sensor_interval=1)
+
+    bot_main, session = load_bot(url)
+    # Лимиты Telegram здесь не при чём: иначе очередь исходящих копит сообщения и искажает память
+    bot_main.outbound_global_rate = 1e6
+    bot_main.outbound_chat_rate = 1e6
+    await bot_main.on_startup()
+
+    stats = LoadStats()
+    memory_trend = []
+    try:
+        # Разогрев: кэши, соединения и записи FSM уже созданы к началу замера
+        await asyncio.gather(*(
+            virtual_user(bot_main, 100_000 + user, LoadStats(), 0, 1) for user in range(args.users)
+        ))
+        gc.collect()
+        tracemalloc.start(args.frames)
+        baseline = tracemalloc.take_snapshot()
+
+        async def sample_memory():
+            while True:
+                await asyncio.sleep(args.memory_interval)
+                current, _ = tracemalloc.get_traced_memory()
+                memory_trend.append({"t": round(time.monotonic() - started, 1), "traced_kb": current / 1024})
+
+        started = time.monotonic()
+        sampler = asyncio.create_task(sample_memory())
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            virtual_user(bot_main, 100_000 + user, stats, deadline, args.rounds) for user in range(args.users)
+        ))
+        elapsed = time.monotonic() - started
+        sampler.cancel()
+
+        gc.collect()
+        final = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        await bot_main.on_shutdown()
+        await emulator.stop()
+
+    baseline_kb = sum(stat.size for stat in baseline.statistics("filename")) / 1024
+    return {
+        "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {
+            "users": args.users,
+            "rounds": args.rounds,
+            "duration": args.duration,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+        },
+        "results": {
+            "updates": stats.updates,
+            "errors": stats.errors,
+            "seconds": elapsed,
+            "updates_per_second": stats.updates / elapsed,
+            "latency": summarize(stats.all_latencies()),
+            "by_step": {step: summarize(values) for step, values in stats.latencies.items()},
+            "controller_requests": emulator.requests,
+            "messages_sent": session.sent,
+            "messages_edited": session.edited,
+            "memory": {
+                "baseline_kb": baseline_kb,
+                "final_kb": current / 1024,
+                "growth_kb": current / 1024 - baseline_kb,
+                "peak_kb": peak / 1024,
+                "trend": memory_trend,
+                "top_growth": memory_top(baseline, final),
+            },
+        },
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон хендлеров через dp.feed_update")
+    parser.add_argument("--users", type=int, default=200, help="одновременных виртуальных пользователей")
+    parser.add_argument("--rounds", type=int, default=5, help="проходов сценария на пользователя")
+    parser.add_argument("--duration", type=float, default=0, help="длительный прогон: не меньше стольких секунд")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--memory-interval", type=float, default=5)
+    parser.add_argument("--frames", type=int, default=1, help="глубина стека tracemalloc")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path)
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(message)s")
+    args = parse_args()
+    output = (args.output or ROOT / "bench" / "results" / f"load-{time.strftime('%Y%m%d-%H%M%S')}.json").resolve()
+    report = asyncio.run(run(args))
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    results = report["results"]
+    print(
+        f"{results['updates']} обновлений за {results['seconds']:.1f} с "
+        f"({results['updates_per_second']:.0f}/с), ошибок {results['errors']}\n"
+        f"p50 {results['latency']['p50_ms']:.1f} мс, p99 {results['latency']['p99_ms']:.1f} мс\n"
+        f"Память: +{results['memory']['growth_kb']:.0f} КБ (пик {results['memory']['peak_kb']:.0f} КБ)"
+    )
+    print(f"Результаты сохранены в {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import argparse
+import datetime
+import json
+import platform
+import random
+import time
+import timeit
+import tracemalloc
+from pathlib import Path
+
+from harness import ROOT
+
+import codec
+from models import STATE_KEYS, StateSnapshot, decode_value
+from templates import ADVICE, render_recommendation, render_state
+
+
+# ---------- Как было: для сравнения ----------
+def baseline_render_state(snapshot: StateSnapshot) -> str:
+    return (
+        ("⚠️ Контроллер недоступен, показаны последние известные значения\n\n" if snapshot.stale else "")
+        + "📟 Состояние системы:\n\n"
+        f"💨 Есть кто дома? - {'да' if snapshot.inside_presence else 'нет'}\n"
+        f"👣 Есть движение перед домом? - {'да' if snapshot.pir_motion else 'нет'}\n"
+        f"📏 Освещенность на улице - {snapshot.last_ldr}\n"
+        f"🪟 Уровень газа в доме - {snapshot.last_mq2}\n"
+        f"🔐 Температура на улице - {snapshot.last_temp}\n"
+        f"📏 Влажность на улице - {snapshot.last_hum}\n"
+        f"🪟 Цвет освещения (None - выключено) - {snapshot.led_color}\n"
+        f"🔐 Окно открыто? - {'да' if snapshot.window_open else 'нет'}\n"
+        f"🛠 Пищалка включена? - {'да' if snapshot.buzzer_active else 'нет'}\n"
+    )
+
+
+def baseline_recommendation(temp, hum) -> str:
+    if temp < 10 and hum > 70:
+        advice = ADVICE["cold", True]
+    elif temp < 10 and hum <= 70:
+        advice = ADVICE["cold", False]
+    elif 10 <= temp < 20 and hum > 70:
+        advice = ADVICE["cool", True]
+    elif 10 <= temp < 20 and hum <= 70:
+        advice = ADVICE["cool", False]
+    elif temp >= 20 and hum > 70:
+        advice = ADVICE["warm", True]
+    else:
+        advice = ADVICE["warm", False]
+    return f"🌡 Температура: {temp}°C\n💧 Влажность: {hum}%\n\n" + advice
+
+
+def baseline_decode(body: bytes) -> dict:
+    return json.loads(body)["value"]
+
+
+def decode(body: bytes) -> dict:
+    return {key: decode_value(key, value) for key, value in codec.loads(body)["value"].items()}
+
+
+# ---------- Входные данные ----------
+def random_values(rnd: random.Random) -> dict:
+    return {
+        "inside_presence": rnd.random() < 0.5,
+        "pir_motion": rnd.random() < 0.1,
+        "last_ldr": rnd.randint(0, 1023),
+        "last_mq2": rnd.randint(50, 400),
+        "last_temp": rnd.randint(-20, 35),
+        "last_hum": rnd.randint(20, 100),
+        "led_color": rnd.choice(("None", "red", "green", "blue")),
+        "window_open": rnd.random() < 0.5,
+        "buzzer_active": False,
+        "alarm_active": rnd.random() < 0.5,
+    }
+
+
+# ---------- Замеры ----------
+def per_call(func, args: list, repeat: int) -> dict:
+    # Время на вызов (лучший из повторов) и сколько памяти остаётся за каждым результатом
+    calls = iter(args * (repeat + 1))
+    best = min(timeit.repeat(lambda: func(*next(calls)), number=len(args), repeat=repeat))
+    tracemalloc.start()
+    results = [func(*call) for call in args]
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return {"us_per_call": best / len(args) * 1e6, "bytes_per_call": retained / len(args)}
+
+
+def compare(baseline: dict, optimized: dict) -> dict:
+    return {
+        "baseline": baseline,
+        "optimized": optimized,
+        "speedup": baseline["us_per_call"] / optimized["us_per_call"],
+    }
+
+
+def run(args: argparse.Namespace) -> dict:
+    rnd = random.Random(args.seed)
+    values = [random_values(rnd) for _ in range(args.snapshots)]
+    # Уникальных снимков больше, чем вмещает кэш, - каждый рендер промах;
+    # одинаковые - панель, которая перерисовывается без изменений
+    unique = [(StateSnapshot(**random_values(rnd)),) for _ in range(4 * render_state.cache_info().maxsize)]
+    repeated = [(StateSnapshot(**values[0]),)] * args.snapshots
+    weather = [(v["last_temp"], v["last_hum"]) for v in values]
+    bodies = [(json.dumps({"value": v}).encode(),) for v in values]
+
+    render_state.cache_clear()
+    results = {
+        "state_unique": compare(per_call(baseline_render_state, unique, args.repeat), per_call(render_state, unique, args.repeat)),
+        "state_repeated": compare(
+            per_call(baseline_render_state, repeated, args.repeat), per_call(render_state, repeated, args.repeat)
+        ),
+        "recommendation": compare(
+            per_call(baseline_recommendation, weather, args.repeat), per_call(render_recommendation, weather, args.repeat)
+        ),
+        "decode_state": compare(per_call(baseline_decode, bodies, args.repeat), per_call(decode, bodies, args.repeat)),
+        "snapshot_bytes": tracemalloc_size(values),
+    }
+    return {
+        "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "json_backend": codec.BACKEND,
+        "config": {"snapshots": args.snapshots, "repeat": args.repeat, "seed": args.seed},
+        "results": results,
+    }
+
+
+def tracemalloc_size(values: list[dict]) -> float:
+    tracemalloc.start()
+    snapshots = [StateSnapshot(**{key: v[key] for key in STATE_KEYS}) for v in values]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del snapshots
+    return size / len(values)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Стоимость рендера текстов и разбора ответов контроллера")
+    parser.add_argument("--snapshots", type=int, default=1000, help="входных наборов на замер")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output = (args.output or ROOT / "bench" / "results" / f"render-{time.strftime('%Y%m%d-%H%M%S')}.json").resolve()
+    report = run(args)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    for name, result in report["results"].items():
+        if not isinstance(result, dict):
+            print(f"{name}: {result:.0f} Б")
+            continue
+        baseline, optimized = result["baseline"], result["optimized"]
+        print(
+            f"{name}: {baseline['us_per_call']:.2f} -> {optimized['us_per_call']:.2f} мкс "
+            f"(x{result['speedup']:.1f}), {baseline['bytes_per_call']:.0f} -> {optimized['bytes_per_call']:.0f} Б"
+        )
+    print(f"JSON: {report['json_backend']}. Результаты сохранены в {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import platform
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from emulator import ControllerEmulator
+from harness import ROOT
+
+from controller import ControllerClient
+from outbox import DURABLE_KEYS, Outbox
+
+
+# ---------- Разбор очередей после восстановления связи ----------
+# Много домов (каждый со своим клиентом, но все на одном эмуляторе) копят
+# отложенные команды, пока «связи нет», а затем очереди разбираются одним
+# проходом, как это делает воркер бота.
+VALUES = {
+    "led_color": ("red", "green", "blue", "None"),
+    "window_open": (True, False),
+    "buzzer_active": (True, False),
+    "alarm_active": (True, False),
+    "control_mode": ("auto", "manual"),
+    "alarm_code": ("1234", "4321"),
+}
+
+
+async def run(args: argparse.Namespace) -> dict:
+    emulator = ControllerEmulator(latency=args.latency, jitter=args.jitter, bulk=not args.no_bulk, seed=args.seed)
+    url = await emulator.start()
+    rnd = random.Random(args.seed)
+    clients = {f"home-{i}": ControllerClient(url, limit=4) for i in range(args.homes)}
+    await asyncio.gather(*(client.start() for client in clients.values()))
+
+    outbox = Outbox(str(Path(tempfile.mkdtemp(prefix="outbox-bench-")) / "outbox.sqlite3"), slots=args.slots)
+    await outbox.open()
+    try:
+        keys = sorted(DURABLE_KEYS)
+        started = time.perf_counter()
+        for home_id in clients:
+            for _ in range(args.commands):
+                key = rnd.choice(keys)
+                await outbox.put(home_id, key, rnd.choice(VALUES[key]))
+        enqueue = time.perf_counter() - started
+        queued = len(outbox)
+
+        emulator.hits.clear()
+        started = time.perf_counter()
+        replayed = await asyncio.gather(
+            *(outbox.replay(home_id, client.write_ordered) for home_id, client in clients.items())
+        )
+        drain = time.perf_counter() - started
+    finally:
+        await outbox.close()
+        await asyncio.gather(*(client.close() for client in clients.values()))
+        await emulator.stop()
+
+    delivered = sum(len(done) for done, _ in replayed)
+    return {
+        "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {
+            "homes": args.homes,
+            "commands": args.commands,
+            "slots": args.slots,
+            "latency": args.latency,
+            "bulk": not args.no_bulk,
+        },
+        "results": {
+            "commands_put": args.homes * args.commands,
+            # Повторные команды одному элементу схлопнулись до последней
+            "queued_after_compaction": queued,
+            "enqueue_per_command_ms": enqueue / (args.homes * args.commands) * 1000,
+            "delivered": delivered,
+            "drain_seconds": drain,
+            "commands_per_second": delivered / drain,
+            "controller_requests": emulator.requests,
+            "by_endpoint": dict(emulator.hits.most_common()),
+        },
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Скорость разбора отложенных команд после восстановления связи")
+    parser.add_argument("--homes", type=int, default=200)
+    parser.add_argument("--commands", type=int, default=20, help="команд на дом, пока связи нет")
+    parser.add_argument("--slots", type=int, default=32, help="домов, разбираемых одновременно")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--no-bulk", action="store_true", help="контроллер без /set/batch")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path)
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(message)s")
+    args = parse_args()
+    output = (args.output or ROOT / "bench" / "results" / f"replay-{time.strftime('%Y%m%d-%H%M%S')}.json").resolve()
+    report = asyncio.run(run(args))
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    results = report["results"]
+    print(
+        f"{results['commands_put']} команд -> {results['queued_after_compaction']} после схлопывания, "
+        f"доставлено {results['delivered']} за {results['drain_seconds']:.2f} с "
+        f"({results['commands_per_second']:.0f}/с, запросов {results['controller_requests']})"
+    )
+    print(f"Результаты сохранены в {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import datetime
+import json
+import platform
+import random
+import time
+import timeit
+from pathlib import Path
+
+from harness import ROOT
+
+from aiogram import F
+from aiogram.types import CallbackQuery, User
+
+from actuators import Actuator, ActuatorRegistry, Option
+
+
+# ---------- Реестр на N элементов ----------
+def build_registry(count: int) -> ActuatorRegistry:
+    return ActuatorRegistry(*(
+        Actuator(
+            name=f"a{i}",
+            prefix=f"p{i}",
+            key=f"key_{i}",
+            title=f"Элемент {i}",
+            prompt=f"Управление элементом {i}:",
+            options=(Option("on", "Включить", True), Option("off", "Выключить", False)),
+        )
+        for i in range(count)
+    ))
+
+
+# ---------- Как было: цепочка хендлеров с фильтрами F.data ----------
+# aiogram проверяет хендлеры по очереди, пока фильтр не сработает, - на каждый
+# callback_data свой хендлер (свой фильтр)
+def baseline_filters(registry: ActuatorRegistry) -> list:
+    return [F.data == data for data in registry.actions]
+
+
+def baseline_match(filters: list, callback: CallbackQuery) -> bool:
+    for magic in filters:
+        if magic.resolve(callback):
+            return True
+    return False
+
+
+def callbacks(registry: ActuatorRegistry, count: int, rnd: random.Random) -> list[CallbackQuery]:
+    user = User(id=1, is_bot=False, first_name="bench")
+    data = list(registry.actions)
+    return [
+        CallbackQuery(id=str(i), from_user=user, chat_instance="bench", data=rnd.choice(data))
+        for i in range(count)
+    ]
+
+
+# ---------- Замеры ----------
+def per_call(func, args: list, repeat: int) -> float:
+    calls = iter(args * (repeat + 1))
+    best = min(timeit.repeat(lambda: func(next(calls)), number=len(args), repeat=repeat))
+    return best / len(args) * 1e6
+
+
+def run(args: argparse.Namespace) -> dict:
+    rnd = random.Random(args.seed)
+    results = {}
+    for count in args.actuators:
+        registry = build_registry(count)
+        filters = baseline_filters(registry)
+        updates = callbacks(registry, args.callbacks, rnd)
+        baseline = per_call(lambda callback: baseline_match(filters, callback), updates, args.repeat)
+        optimized = per_call(registry.match, updates, args.repeat)
+        results[str(count)] = {
+            "callbacks": len(registry.actions),
+            "baseline_us": baseline,
+            "registry_us": optimized,
+            "speedup": baseline / optimized,
+        }
+    return {
+        "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {"actuators": args.actuators, "callbacks": args.callbacks, "repeat": args.repeat, "seed": args.seed},
+        "results": results,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Стоимость разбора нажатий ручного режима")
+    parser.add_argument("--actuators", type=int, nargs="+", default=[4, 40, 400], help="размеры реестра")
+    parser.add_argument("--callbacks", type=int, default=1000, help="нажатий на замер")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output = (args.output or ROOT / "bench" / "results" / f"routing-{time.strftime('%Y%m%d-%H%M%S')}.json").resolve()
+    report = run(args)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    for count, result in report["results"].items():
+        print(
+            f"{count} элементов ({result['callbacks']} кнопок): {result['baseline_us']:.2f} -> "
+            f"{result['registry_us']:.2f} мкс (x{result['speedup']:.1f})"
+        )
+    print(f"Результаты сохранены в {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import platform
+import time
+from pathlib import Path
+
+from emulator import EVENTS, ControllerEmulator
+from harness import ROOT, RecordingSession, load_bot, summarize, text_update
+
+
+logger = logging.getLogger("bench")
+
+
+# ---------- Сценарии ----------
+async def bench_state(bot_main, session: RecordingSession, iterations: int, *, cold: bool) -> dict:
+    controller = bot_main.homes.get(bot_main.default_home_id).controller
+    samples = []
+    for i in range(iterations):
+        if cold:
+            controller.cache.clear()
+        # Каждый раз новый чат, чтобы не упираться в лимит сообщений на чат
+        chat_id = 10_000 + i + (iterations if cold else 0)
+        reply = session.wait_for(chat_id)
+        started = time.perf_counter()
+        await bot_main.dp.feed_update(bot_main.bot, text_update(chat_id, "/state"))
+        samples.append(await asyncio.wait_for(reply, 10) - started)
+    return summarize(samples)
+
+
+async def bench_events(bot_main, session: RecordingSession, emulator: ControllerEmulator, iterations: int) -> dict:
+    chat_id = 1
+    await bot_main.subscribers.subscribe(chat_id)
+    samples, missed = [], 0
+    # Соседние события всегда разные - так их пропускает и фильтр переходов в режиме опроса
+    for value in itertools.islice(itertools.cycle(EVENTS), iterations):
+        alert = session.wait_for(chat_id, bot_main.EVENT_MESSAGES[value])
+        started = time.perf_counter()
+        emulator.emit(value)
+        try:
+            samples.append(await asyncio.wait_for(alert, 10) - started)
+        except asyncio.TimeoutError:
+            missed += 1
+        # Пауза с запасом: иначе событие попадёт в пачку предыдущего или упрётся в лимит на чат
+        await asyncio.sleep(1.2 * max(1 / bot_main.outbound_chat_rate, bot_main.event_burst_window))
+    return {**summarize(samples), "missed": missed}
+
+
+async def bench_idle(emulator: ControllerEmulator, seconds: float) -> dict:
+    emulator.hits.clear()
+    await asyncio.sleep(seconds)
+    requests = emulator.requests
+    return {
+        "seconds": seconds,
+        "requests": requests,
+        "requests_per_minute": requests * 60 / seconds,
+        "by_endpoint": dict(emulator.hits.most_common()),
+    }
+
+
+# ---------- Запуск ----------
+async def run(args: argparse.Namespace) -> dict:
+    emulator = ControllerEmulator(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        bulk=not args.no_bulk,
+        push=not args.no_push,
+        seed=args.seed,
+    )
+    url = await emulator.start()
+    emulator.run_generators(sensor_interval=1)
+
+    bot_main, session = load_bot(url)
+    # Повторы одинаковых событий не подавляем - в замере они идут подряд
+    bot_main.event_repeat_window = 0
+
+    results = {}
+    await bot_main.on_startup()
+    try:
+        await asyncio.sleep(args.warmup)
+        logger.warning("Простой: замер запросов к контроллеру...")
+        results["idle"] = await bench_idle(emulator, args.idle_seconds)
+        logger.warning("/state...")
+        results["state_warm"] = await bench_state(bot_main, session, args.iterations, cold=False)
+        results["state_cold"] = await bench_state(bot_main, session, args.iterations, cold=True)
+        logger.warning("Событие -> оповещение...")
+        results["event_to_alert"] = await bench_events(bot_main, session, emulator, args.events)
+    finally:
+        await bot_main.on_shutdown()
+        await emulator.stop()
+
+    return {
+        "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+            "bulk": not args.no_bulk,
+            "push": not args.no_push,
+            "iterations": args.iterations,
+            "events": args.events,
+        },
+        "results": results,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Замеры бота на эмуляторе контроллера")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--no-bulk", action="store_true", help="контроллер без /get/state и /set/batch")
+    parser.add_argument("--no-push", action="store_true", help="контроллер без SSE, события опросом")
+    parser.add_argument("--iterations", type=int, default=50, help="запросов /state в каждом замере")
+    parser.add_argument("--events", type=int, default=12)
+    parser.add_argument("--idle-seconds", type=float, default=60)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="файл для JSON с результатами")
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(message)s")
+    args = parse_args()
+    output = (args.output or ROOT / "bench" / "results" / f"{time.strftime('%Y%m%d-%H%M%S')}.json").resolve()
+    report = asyncio.run(run(args))
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(json.dumps(report["results"], ensure_ascii=False, indent=2))
+    print(f"Результаты сохранены в {output}")
+
+
+if __name__ == "__main__":
+    main()
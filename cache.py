@@ -0,0 +1,74 @@
+import time
+from collections import OrderedDict
+
+
+MISSING = object()
+
+
+# ---------- TTL-кэш с LRU-вытеснением ----------
+# У каждого ключа свой срок жизни; ключ с TTL <= 0 не кэшируется вовсе.
+class TTLCache:
+    def __init__(self, ttls: dict[str, float] | None = None, *, default_ttl: float = 0, max_entries: int = 256):
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def ttl_for(self, key: str) -> float:
+        return self.ttls.get(key, self.default_ttl)
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        self.misses += 1
+        return MISSING
+
+    def get_many(self, keys) -> dict | None:
+        # Все ключи свежие - их значения, иначе None. Считается одним попаданием или промахом
+        now = time.monotonic()
+        values = {}
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                self.misses += 1
+                return None
+            values[key] = entry[1]
+        for key in values:
+            self._entries.move_to_end(key)
+        self.hits += 1
+        return values
+
+    def put(self, key: str, value):
+        ttl = self.ttl_for(key)
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+            "evictions": self.evictions,
+        }
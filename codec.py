@@ -0,0 +1,45 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+# ---------- JSON: быстрый бэкенд, если установлен ----------
+# orjson или msgspec разбирают ответы контроллера в несколько раз быстрее
+# стандартного json; без них всё работает на json. loads принимает bytes и str,
+# dumps всегда отдаёт str - его ждут aiohttp и SQLite.
+if orjson is not None:
+    BACKEND = "orjson"
+    loads = orjson.loads
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+elif msgspec is not None:
+    BACKEND = "msgspec"
+    _decoder = msgspec.json.Decoder()
+    _encoder = msgspec.json.Encoder()
+
+    def loads(data):
+        # Как и у json/orjson, ошибка разбора - ValueError
+        try:
+            return _decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+
+    def dumps(obj) -> str:
+        return _encoder.encode(obj).decode()
+
+else:
+    BACKEND = "json"
+    loads = json.loads
+
+    def dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
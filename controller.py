@@ -0,0 +1,405 @@
+import asyncio
+import logging
+from collections.abc import Collection
+
+import aiohttp
+
+import codec
+from cache import MISSING, TTLCache
+from metrics import REGISTRY
+from models import StateSnapshot, decode_value
+from resilience import CircuitBreaker, ControllerUnavailable, ServerError, backoff
+from writes import WriteBatcher
+
+
+logger = logging.getLogger(__name__)
+
+# Ключи, для которых устаревшее значение хуже, чем никакого
+NO_STALE = frozenset({"event"})
+
+REQUEST_LATENCY = REGISTRY.histogram("controller_request_seconds", "Время HTTP-запросов к контроллеру", ("endpoint",))
+REQUEST_FAILURES = REGISTRY.counter("controller_failures_total", "Запросы, не удавшиеся после всех повторов")
+
+
+# ---------- Клиент контроллера ----------
+# Одна aiohttp-сессия на весь процесс: соединения переиспользуются (keep-alive),
+# поэтому опрос датчиков не платит за TCP+TLS рукопожатие на каждый запрос.
+class ControllerClient:
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        limit: int = 10,
+        keepalive_timeout: float = 30,
+        connect_timeout: float = 3,
+        request_timeout: float = 5,
+        cache_ttls: dict[str, float] | None = None,
+        cache_size: int = 256,
+        retries: int = 2,
+        breaker_threshold: int = 3,
+        breaker_reset: float = 15,
+        write_window: float = 0.05,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=request_timeout, connect=connect_timeout)
+        self._session: aiohttp.ClientSession | None = None
+        # None - ещё не проверяли, есть ли у контроллера /get/state
+        self._bulk_state: bool | None = None
+        self._bulk_set: bool | None = None
+        self.cache = TTLCache(cache_ttls, max_entries=cache_size)
+        # Одновременные промахи по одному ключу ждут один и тот же запрос
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._bulk_inflight: asyncio.Future | None = None
+        self._write_versions: dict[str, int] = {}
+        self.retries = retries
+        self.breaker = CircuitBreaker(threshold=breaker_threshold, reset_timeout=breaker_reset)
+        self._last_known: dict[str, object] = {}
+        self._stale: set[str] = set()
+        self.writes = WriteBatcher(self.set_many, window=write_window)
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, json_serialize=codec.dumps)
+            logger.info(f"[CTL] Пул соединений открыт: {self.base_url} (limit={self.limit}, json={codec.BACKEND})")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("[CTL] Пул соединений закрыт")
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            raise RuntimeError("ControllerClient не запущен: вызовите start()")
+        return self._session
+
+    @staticmethod
+    def _request_kwargs(timeout: float | None) -> dict:
+        # Без явного таймаута действует таймаут сессии
+        return {} if timeout is None else {"timeout": aiohttp.ClientTimeout(total=timeout)}
+
+    # ---------- Устойчивость: повторы и предохранитель ----------
+    async def _call(self, request, *, retries: int):
+        if not self.breaker.allow():
+            raise ControllerUnavailable(self.base_url)
+
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    result = await request()
+                except (aiohttp.ClientError, asyncio.TimeoutError, ServerError) as e:
+                    error = e
+                except Exception as e:
+                    # Непредвиденный ответ повторять бесполезно, но это тоже неудача:
+                    # иначе пробный запрос так и не освободится
+                    error = e
+                    break
+                else:
+                    self.breaker.success()
+                    return result
+                if attempt < retries:
+                    await asyncio.sleep(backoff(attempt))
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+
+        REQUEST_FAILURES.inc()
+        if self.breaker.failure():
+            logger.warning(f"[CTL] Контроллер {self.base_url} недоступен ({error!r}), предохранитель разомкнут")
+        raise ControllerUnavailable(self.base_url) from error
+
+    def is_stale(self, key: str) -> bool:
+        return key in self._stale
+
+    def last_known(self, key: str):
+        # Последнее прочитанное или записанное значение, без запроса к контроллеру
+        return self._last_known.get(key)
+
+    # ---------- Чтение ----------
+    async def get(self, key: str, *, timeout: float | None = None, fresh: bool = False):
+        # fresh - мимо кэша: проверить, что контроллер действительно принял запись
+        value = MISSING if fresh else self.cache.get(key)
+        if value is not MISSING:
+            return value
+
+        try:
+            value = await self._get_shared(key, timeout)
+        except ControllerUnavailable:
+            # Пока контроллер лежит, отвечаем последним известным значением
+            if key in NO_STALE:
+                return None
+            self._stale.add(key)
+            return self._last_known.get(key)
+
+        if value is not None:
+            self._last_known[key] = value
+            self._stale.discard(key)
+        return value
+
+    async def _get_shared(self, key: str, timeout: float | None):
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        version = self._write_versions.get(key, 0)
+        try:
+            value = await self._call(lambda: self.fetch(key, timeout=timeout), retries=self.retries)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже проброшено вызывающему, ожидающие получат его сами
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            # Если за время запроса значение успели записать, прочитанное уже устарело
+            if value is not None and self._write_versions.get(key, 0) == version:
+                self.cache.put(key, value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    async def fetch(self, key: str, *, timeout: float | None = None):
+        with REQUEST_LATENCY.time((f"get/{key}",)):
+            async with self.session.get(f"{self.base_url}/get/{key}", **self._request_kwargs(timeout)) as r:
+                if r.status >= 500:
+                    raise ServerError(f"HTTP {r.status}")
+                if r.status == 200:
+                    return decode_value(key, self._payload(await r.read()))
+            return None
+
+    @staticmethod
+    def _payload(body: bytes):
+        # Ответ 200, но не {"value": ...} (например, HTML-страница прокси) - сбой контроллера
+        try:
+            return codec.loads(body)["value"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise ServerError(f"Некорректный ответ: {e!r}") from e
+
+    # ---------- Запись ----------
+    # Результат записи: True - принята, False - контроллер ответил, но отказал (4xx),
+    # None - контроллер недоступен (сеть, таймаут, 5xx), команду можно повторить позже
+    async def set(self, key: str, value, *, timeout: float | None = None) -> bool | None:
+        try:
+            ok = await self._call(lambda: self._post(key, value, timeout), retries=0)
+        except ControllerUnavailable:
+            ok = None
+        self._written(key, value, ok)
+        return ok
+
+    async def set_many(self, values: dict[str, object]) -> dict[str, bool | None]:
+        # Одним запросом через /set/batch, если контроллер его умеет, иначе параллельно
+        if len(values) > 1 and self._bulk_set is not False:
+            try:
+                ok = await self._call(lambda: self._post_batch(values), retries=0)
+            except ControllerUnavailable:
+                for key, value in values.items():
+                    self._written(key, value, None)
+                return dict.fromkeys(values)
+            if ok:
+                for key, value in values.items():
+                    self._written(key, value, ok)
+                return dict.fromkeys(values, True)
+            # Пакет отклонён целиком или не поддерживается - по одной, чтобы
+            # отказ в одной команде не задел остальные
+
+        results = await asyncio.gather(*(self.set(key, value) for key, value in values.items()))
+        return dict(zip(values, results))
+
+    async def write_ordered(self, values: dict[str, object]) -> dict[str, bool | None]:
+        # Отложенные команды: одним /set/batch, если контроллер его умеет, иначе по
+        # одной в заданном порядке до первой недоступности. Отказ в одной команде
+        # не останавливает остальные. Ключей, до которых не дошло, в ответе нет
+        if len(values) > 1 and self._bulk_set is not False:
+            try:
+                ok = await self._call(lambda: self._post_batch(values), retries=self.retries)
+            except ControllerUnavailable:
+                return {}
+            if ok:
+                for key, value in values.items():
+                    self._written(key, value, ok)
+                return dict.fromkeys(values, True)
+            # Пакет отклонён целиком или не поддерживается - по одной, чтобы понять,
+            # какая команда не нравится контроллеру
+
+        results = {}
+        for key, value in values.items():
+            results[key] = await self.set(key, value)
+            if results[key] is None:
+                break
+        return results
+
+    async def write(self, key: str, value) -> bool | None:
+        return await self.writes.submit(key, value)
+
+    def _written(self, key: str, value, ok: bool | None):
+        self._write_versions[key] = self._write_versions.get(key, 0) + 1
+        if ok:
+            self.cache.put(key, value)
+            self._last_known[key] = value
+            self._stale.discard(key)
+        else:
+            self.cache.invalidate(key)
+
+    async def _post(self, key: str, value, timeout: float | None) -> bool:
+        with REQUEST_LATENCY.time((f"set/{key}",)):
+            async with self.session.post(f"{self.base_url}/set/{key}", json={key: value},
+                                         **self._request_kwargs(timeout)) as r:
+                if r.status >= 500:
+                    raise ServerError(f"HTTP {r.status}")
+                return r.status == 200
+
+    async def _post_batch(self, values: dict[str, object]) -> bool | None:
+        with REQUEST_LATENCY.time(("set/batch",)):
+            async with self.session.post(f"{self.base_url}/set/batch", json=values) as r:
+                if r.status >= 500:
+                    raise ServerError(f"HTTP {r.status}")
+                if r.status in (404, 405):
+                    self._bulk_set = False
+                    logger.info("[CTL] /set/batch не поддерживается, запись параллельными запросами")
+                    return None
+                self._bulk_set = True
+                return r.status == 200
+
+    # ---------- Снимок состояния ----------
+    async def get_state_snapshot(self, *, fresh: Collection[str] = ()) -> StateSnapshot:
+        # Сначала пробуем общий эндпоинт /get/state, иначе - все поля параллельно.
+        # Ключи из fresh читаются с контроллера, даже если они есть в кэше
+        keys = StateSnapshot.keys()
+        if self._bulk_state is not False:
+            # Все поля свежие в кэше - снимок без запроса к контроллеру
+            cached = None if fresh else self._cached_snapshot()
+            if cached is not None:
+                return cached
+
+            try:
+                values = await self._get_bulk_shared()
+            except ControllerUnavailable:
+                values = None
+            if values is not None:
+                for key in keys:
+                    if values.get(key) is not None:
+                        self._last_known[key] = values[key]
+                        self._stale.discard(key)
+                return StateSnapshot(**{key: values.get(key) for key in keys})
+
+        values = await asyncio.gather(*(self.get(key, fresh=key in fresh) for key in keys))
+        return StateSnapshot(**dict(zip(keys, values)), stale=any(key in self._stale for key in keys))
+
+    def _cached_snapshot(self) -> StateSnapshot | None:
+        values = self.cache.get_many(StateSnapshot.keys())
+        return StateSnapshot(**values) if values is not None else None
+
+    async def _get_bulk_shared(self) -> dict | None:
+        # Одновременные запросы снимка ждут один и тот же /get/state
+        if self._bulk_inflight is not None:
+            return await asyncio.shield(self._bulk_inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._bulk_inflight = future
+        versions = dict(self._write_versions)
+        try:
+            values = await self._call(self._get_bulk_state, retries=self.retries)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            future.set_result(values)
+            # Ключи, записанные за время запроса, в кэш не кладём - прочитанное уже устарело
+            for key, value in (values or {}).items():
+                if value is not None and self._write_versions.get(key, 0) == versions.get(key, 0):
+                    self.cache.put(key, value)
+            return values
+        finally:
+            self._bulk_inflight = None
+
+    async def _get_bulk_state(self) -> dict | None:
+        with REQUEST_LATENCY.time(("get/state",)):
+            async with self.session.get(f"{self.base_url}/get/state") as r:
+                if r.status >= 500:
+                    raise ServerError(f"HTTP {r.status}")
+                if r.status == 200:
+                    self._bulk_state = True
+                    values = self._payload(await r.read())
+                    if not isinstance(values, dict):
+                        raise ServerError(f"Некорректный ответ /get/state: {values!r:.100}")
+                    return {key: decode_value(key, value) for key, value in values.items()}
+                if r.status in (404, 405) and self._bulk_state is None:
+                    self._bulk_state = False
+                    logger.info("[CTL] /get/state не поддерживается, опрос полей параллельно")
+            return None
+
+    # ---------- Post-запросы ----------
+    async def set_alarm_code(self, new_code: str) -> bool:
+        return await self.set("alarm_code", new_code)
+
+    async def set_window_open(self, is_open: bool) -> bool:
+        return await self.write("window_open", is_open)
+
+    async def set_control_mode(self, mode: str) -> bool:
+        return await self.set("control_mode", mode)
+
+    async def set_alarm_active(self, active: bool) -> bool:
+        return await self.write("alarm_active", active)
+
+    async def set_buzzer_active(self, active: bool) -> bool:
+        return await self.write("buzzer_active", active)
+
+    async def set_led_color(self, color: str) -> bool:
+        return await self.write("led_color", color)
+
+    # ---------- Get-запросы ----------
+    async def get_alarm_code(self) -> str | None:
+        return await self.get("alarm_code")
+
+    async def get_event(self) -> str | None:
+        return await self.get("event")
+
+    async def get_pir_motion(self) -> bool | None:
+        return await self.get("pir_motion")
+
+    async def get_inside_presence(self) -> bool | None:
+        return await self.get("inside_presence")
+
+    async def get_last_mq2(self) -> int | None:
+        return await self.get("last_mq2")
+
+    async def get_last_ldr(self) -> int | None:
+        return await self.get("last_ldr")
+
+    async def get_last_temp(self) -> int | None:
+        return await self.get("last_temp")
+
+    async def get_last_hum(self) -> int | None:
+        return await self.get("last_hum")
+
+    async def get_window_open(self) -> bool | None:
+        return await self.get("window_open")
+
+    async def get_control_mode(self) -> str | None:
+        return await self.get("control_mode")
+
+    async def get_alarm_active(self) -> bool | None:
+        return await self.get("alarm_active")
+
+    async def get_buzzer_active(self) -> bool | None:
+        return await self.get("buzzer_active")
+
+    async def get_led_color(self) -> str | None:
+        return await self.get("led_color")
@@ -0,0 +1,197 @@
+import asyncio
+import contextlib
+import logging
+import sqlite3
+import time
+
+from aiogram.exceptions import TelegramBadRequest
+
+from outbound import OutboundQueue
+
+
+logger = logging.getLogger(__name__)
+
+
+class Panel:
+    __slots__ = ("chat_id", "message_id", "text", "pending", "edited_at", "task")
+
+    def __init__(self, chat_id: int, message_id: int, text: str | None = None):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        # text - что сейчас показано, pending - что покажем при ближайшей правке
+        self.text = text
+        self.pending: str | None = None
+        self.edited_at = 0.0
+        self.task: asyncio.Task | None = None
+
+
+# ---------- Живые панели состояния ----------
+# В чате одно закреплённое сообщение с состоянием дома, которое правится на
+# месте. Новый текст сначала сравнивается с показанным: совпал - к Telegram
+# не обращаемся. Одно сообщение правится не чаще раза в min_interval секунд,
+# а версии, пришедшие за это время, просто заменяют ожидающую - уходит только
+# последняя. Сами правки идут через очередь исходящих и делят её лимиты.
+#
+# Номера сообщений хранятся в SQLite: панели переживают перезапуск, а при
+# shared=True их видят все процессы (как и реестр подписчиков).
+class DashboardRegistry:
+    def __init__(self, path: str, *, min_interval: float = 5, shared: bool = False):
+        self.path = path
+        self.min_interval = min_interval
+        self.shared = shared
+        self.outbound: OutboundQueue | None = None
+        self.edits = 0
+        self.skipped = 0
+        self._db: sqlite3.Connection | None = None
+        self._data_version: int | None = None
+        self._lock = asyncio.Lock()
+        self._panels: dict[int, Panel] = {}
+
+    async def open(self, outbound: OutboundQueue):
+        self.outbound = outbound
+        self._db = await asyncio.to_thread(self._connect)
+        await asyncio.to_thread(self._reload)
+        logger.info(f"[DASH] Загружено панелей: {len(self._panels)}")
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS dashboards ("
+            " chat_id INTEGER PRIMARY KEY,"
+            " message_id INTEGER NOT NULL)"
+        )
+        db.commit()
+        return db
+
+    def _reload(self):
+        self._data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        rows = dict(self._db.execute("SELECT chat_id, message_id FROM dashboards").fetchall())
+        for chat_id in [c for c, p in self._panels.items() if rows.get(c) != p.message_id]:
+            self._drop(chat_id)
+        for chat_id, message_id in rows.items():
+            if chat_id not in self._panels:
+                self._panels[chat_id] = Panel(chat_id, message_id)
+
+    def _refresh(self):
+        if not self.shared or self._db is None:
+            return
+        if self._db.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+            self._reload()
+
+    async def close(self):
+        for chat_id in list(self._panels):
+            self._drop(chat_id)
+        if self._db is not None:
+            await asyncio.to_thread(self._db.close)
+            self._db = None
+
+    # ---------- Чтение ----------
+    def __contains__(self, chat_id: int) -> bool:
+        self._refresh()
+        return chat_id in self._panels
+
+    def chats(self) -> list[int]:
+        self._refresh()
+        return list(self._panels)
+
+    # ---------- Открытие и закрытие панели ----------
+    async def show(self, chat_id: int, text: str) -> bool:
+        # Новая панель внизу чата; прежняя открепляется и больше не правится.
+        # Панель - отдельное сообщение: склеенные с ней ответы затёрла бы первая же правка
+        old = self._panels.get(chat_id)
+        try:
+            message = await self.outbound.send(chat_id, text, merge=False)
+        except Exception as e:
+            logger.warning(f"[DASH] Не удалось отправить панель в чат {chat_id}: {e!r}")
+            return False
+        with contextlib.suppress(Exception):
+            await self.outbound.bot.pin_chat_message(chat_id, message.message_id, disable_notification=True)
+        if old is not None:
+            self._drop(chat_id)
+            with contextlib.suppress(Exception):
+                await self.outbound.bot.unpin_chat_message(chat_id, message_id=old.message_id)
+
+        panel = self._panels[chat_id] = Panel(chat_id, message.message_id, text)
+        panel.edited_at = time.monotonic()
+        await self._write(
+            "INSERT INTO dashboards (chat_id, message_id) VALUES (?, ?) "
+            "ON CONFLICT(chat_id) DO UPDATE SET message_id = excluded.message_id",
+            (chat_id, message.message_id),
+        )
+        logger.info(f"[DASH] Панель открыта в чате {chat_id}")
+        return True
+
+    async def hide(self, chat_id: int) -> bool:
+        self._refresh()
+        panel = self._panels.get(chat_id)
+        if panel is None:
+            return False
+        self._drop(chat_id)
+        await self._write("DELETE FROM dashboards WHERE chat_id = ?", (chat_id,))
+        with contextlib.suppress(Exception):
+            await self.outbound.bot.unpin_chat_message(chat_id, message_id=panel.message_id)
+        logger.info(f"[DASH] Панель закрыта в чате {chat_id}")
+        return True
+
+    # ---------- Обновление ----------
+    def update(self, chat_id: int, text: str):
+        panel = self._panels.get(chat_id)
+        if panel is None:
+            return
+        if panel.task is None and text == panel.text:
+            self.skipped += 1
+            return
+        panel.pending = text
+        if panel.task is None:
+            self._schedule(panel)
+
+    def _schedule(self, panel: Panel):
+        delay = max(0.0, panel.edited_at + self.min_interval - time.monotonic())
+        panel.task = asyncio.create_task(self._flush(panel, delay))
+
+    async def _flush(self, panel: Panel, delay: float):
+        try:
+            await asyncio.sleep(delay)
+            text, panel.pending = panel.pending, None
+            if text is None or text == panel.text:
+                self.skipped += 1
+                return
+            panel.edited_at = time.monotonic()
+            try:
+                await self.outbound.edit(panel.chat_id, panel.message_id, text)
+            except TelegramBadRequest as e:
+                # Сообщение удалили или оно больше не правится - панели нет
+                logger.warning(f"[DASH] Панель в чате {panel.chat_id} недоступна: {e.message}")
+                await self._forget(panel)
+                return
+            except Exception as e:
+                # Показанный текст не меняем: следующее обновление повторит правку
+                logger.warning(f"[DASH] Не удалось обновить панель в чате {panel.chat_id}: {e!r}")
+                return
+            panel.text = text
+            self.edits += 1
+        finally:
+            panel.task = None
+            if panel.pending is not None and self._panels.get(panel.chat_id) is panel:
+                self._schedule(panel)
+
+    async def _forget(self, panel: Panel):
+        if self._panels.get(panel.chat_id) is panel:
+            del self._panels[panel.chat_id]
+            await self._write(
+                "DELETE FROM dashboards WHERE chat_id = ? AND message_id = ?", (panel.chat_id, panel.message_id)
+            )
+
+    def _drop(self, chat_id: int):
+        panel = self._panels.pop(chat_id, None)
+        if panel is not None and panel.task is not None and panel.task is not asyncio.current_task():
+            panel.task.cancel()
+
+    async def _write(self, sql: str, params: tuple):
+        async with self._lock:
+            await asyncio.to_thread(self._execute, sql, params)
+
+    def _execute(self, sql: str, params: tuple):
+        with self._db:
+            self._db.execute(sql, params)
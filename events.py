@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import random
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+import aiohttp
+
+import codec
+from controller import ControllerClient
+
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- Событие контроллера ----------
+@dataclass
+class ControllerEvent:
+    value: str
+    seq: int | None = None
+    ts: float = field(default_factory=time.time)
+
+
+class PushUnavailable(Exception):
+    pass
+
+
+# ---------- Подписка на события ----------
+# Основной режим - Server-Sent Events с /subscribe/event: контроллер сам присылает
+# событие, как только оно произошло. Пока поток не подключён (переподключение,
+# сбои), подписка берёт ответы /get/event из очереди polled - её наполняет
+# планировщик опроса. Если контроллер не умеет SSE или push_failures попыток
+# подряд не удались, подписка на push_retry_interval переходит на опрос и
+# потом снова пробует push.
+class EventStream:
+    def __init__(
+        self,
+        controller: ControllerClient,
+        *,
+        polled: asyncio.Queue,
+        heartbeat_timeout: float = 60,
+        reconnect_min: float = 0.5,
+        reconnect_max: float = 30,
+        push_retry_interval: float = 300,
+        push_failures: int = 3,
+    ):
+        self.controller = controller
+        self.heartbeat_timeout = heartbeat_timeout
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.push_retry_interval = push_retry_interval
+        self.push_failures = push_failures
+        self.polled = polled
+        self.mode = "push"
+        # Поток SSE действительно открыт; иначе события нужно опрашивать
+        self.connected = False
+        self._last_event_id: str | None = None
+
+    async def __aiter__(self):
+        delay = self.reconnect_min
+        failures = 0
+        while True:
+            try:
+                async for event in self._subscribe():
+                    delay, failures = self.reconnect_min, 0
+                    yield event
+                # Сервер закрыл поток штатно - сразу переподключаемся
+                continue
+            except PushUnavailable as e:
+                reason = str(e)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                failures += 1
+                if failures < self.push_failures:
+                    logger.warning(f"[EVENTS] Поток событий прерван: {e!r}, переподключение через {delay:.1f} с")
+                    # Пока ждём переподключения, события приходят опросом
+                    async for event in self._poll(delay * random.uniform(0.8, 1.2)):
+                        yield event
+                    delay = min(delay * 2, self.reconnect_max)
+                    continue
+                reason = f"{failures} неудачных попыток подряд, {e!r}"
+
+            logger.info(f"[EVENTS] Push недоступен ({reason}), переход на опрос /get/event")
+            self.mode = "poll"
+            async for event in self._poll(self.push_retry_interval):
+                yield event
+            self.mode = "push"
+            delay, failures = self.reconnect_min, 0
+
+    async def _subscribe(self):
+        headers = {"Accept": "text/event-stream"}
+        if self._last_event_id is not None:
+            headers["Last-Event-ID"] = self._last_event_id
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=self.heartbeat_timeout)
+
+        async with self.controller.session.get(
+            f"{self.controller.base_url}/subscribe/event", headers=headers, timeout=timeout
+        ) as r:
+            if r.status in (404, 405, 501):
+                raise PushUnavailable(f"HTTP {r.status}")
+            if r.status != 200:
+                raise aiohttp.ClientResponseError(r.request_info, r.history, status=r.status)
+            if not r.content_type.startswith("text/event-stream"):
+                raise PushUnavailable(r.content_type)
+
+            logger.info("[EVENTS] Подписка на события контроллера установлена (SSE)")
+            # Опрошенное до подключения устарело: пропущенное контроллер дошлёт по Last-Event-ID
+            while not self.polled.empty():
+                self.polled.get_nowait()
+            self.connected = True
+            try:
+                async for event in self._read(r):
+                    yield event
+            finally:
+                self.connected = False
+
+    async def _read(self, r: aiohttp.ClientResponse):
+        event_id, data = None, []
+        async for raw in r.content:
+            line = raw.decode("utf-8").rstrip("\r\n")
+            if not line:
+                if data:
+                    event = self._parse(event_id, "\n".join(data))
+                    if event is not None:
+                        yield event
+                event_id, data = None, []
+            elif line.startswith(":"):
+                # Комментарий-heartbeat
+                continue
+            else:
+                name, _, value = line.partition(":")
+                value = value.removeprefix(" ")
+                if name == "data":
+                    data.append(value)
+                elif name == "id":
+                    event_id = value
+
+    def _parse(self, event_id: str | None, data: str) -> ControllerEvent | None:
+        if event_id is not None:
+            self._last_event_id = event_id
+        try:
+            payload = codec.loads(data)
+        except ValueError:
+            payload = data
+
+        if isinstance(payload, dict):
+            value = payload.get("value")
+            seq = payload.get("seq", event_id)
+        else:
+            value, seq = payload, event_id
+
+        if value is None:
+            return None
+        return ControllerEvent(str(value), int(seq) if seq is not None and str(seq).isdigit() else None)
+
+    async def _poll(self, duration: float):
+        deadline = time.monotonic() + duration
+        while (left := deadline - time.monotonic()) > 0:
+            try:
+                value = await asyncio.wait_for(self.polled.get(), left)
+            except asyncio.TimeoutError:
+                return
+            # Отдаём и "None": по нему фильтр видит, что событие закончилось
+            yield ControllerEvent(value)
+
+
+# ---------- Фильтр событий: только переходы, без повторов ----------
+# Стоит между потоком событий и отправкой сообщений. Уровень ("газ превышен"
+# каждую секунду) превращается в фронт: событие проходит, только когда значение
+# сменилось или пришёл новый порядковый номер от сервера. Одинаковые события
+# внутри repeat_window подавляются, а всё, что пришло в течение burst_window
+# после первого события, уходит в sink одной пачкой.
+class EventDeduplicator:
+    def __init__(
+        self,
+        sink: Callable[[list[ControllerEvent]], Awaitable],
+        *,
+        repeat_window: float = 30,
+        burst_window: float = 2,
+        seq_reset_gap: int = 1000,
+    ):
+        self.sink = sink
+        self.repeat_window = repeat_window
+        self.burst_window = burst_window
+        self.seq_reset_gap = seq_reset_gap
+        self.passed = 0
+        self.suppressed = 0
+        self._last_value: str | None = None
+        self._last_seq: int | None = None
+        self._last_emitted: dict[str, float] = {}
+        self._burst_until = 0.0
+        self._pending: list[ControllerEvent] = []
+        self._flush_task: asyncio.Task | None = None
+
+    def _is_transition(self, event: ControllerEvent) -> bool:
+        if event.seq is not None:
+            last_seq = self._last_seq
+            # Номер меньше последнего - повтор, если только счётчик сервера не начался заново
+            if last_seq is not None and event.seq <= last_seq and last_seq - event.seq < self.seq_reset_gap:
+                return False
+            self._last_seq = event.seq
+            self._last_value = event.value
+            return event.value != "None"
+
+        changed = event.value != self._last_value
+        self._last_value = event.value
+        return changed and event.value != "None"
+
+    async def feed(self, event: ControllerEvent):
+        if not self._is_transition(event):
+            return
+
+        now = time.monotonic()
+        last = self._last_emitted.get(event.value)
+        if last is not None and now - last < self.repeat_window:
+            self.suppressed += 1
+            return
+        self._last_emitted[event.value] = now
+        self.passed += 1
+
+        if now < self._burst_until:
+            self._pending.append(event)
+            return
+
+        # Первое событие пачки уходит сразу, остальные копятся до конца окна
+        self._burst_until = now + self.burst_window
+        self._flush_task = asyncio.create_task(self._flush_later())
+        await self.sink([event])
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.burst_window)
+        await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, []
+        if pending:
+            await self.sink(pending)
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
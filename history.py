@@ -0,0 +1,150 @@
+from array import array
+from bisect import bisect_left
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+SPARK_BARS = "▁▂▃▄▅▆▇█"
+
+
+# ---------- Кольцевой буфер показаний ----------
+# Две колонки фиксированного размера: время (array('d')) и значение (array('f')).
+# Старые показания перезаписываются, так что память не растёт.
+class RingBuffer:
+    __slots__ = ("capacity", "ts", "values", "count", "_head")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.ts = array("d", bytes(8 * capacity))
+        self.values = array("f", bytes(4 * capacity))
+        self.count = 0
+        self._head = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def last_ts(self) -> float | None:
+        return self.ts[self._physical(self.count - 1)] if self.count else None
+
+    def append(self, ts: float, value: float):
+        i = self._head
+        self.ts[i] = ts
+        self.values[i] = value
+        self._head = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def _physical(self, i: int) -> int:
+        return (self._head - self.count + i) % self.capacity
+
+    def _lower_bound(self, since: float) -> int:
+        # Время в буфере возрастает, поэтому начало окна ищется двоичным поиском
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ts[self._physical(mid)] < since:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _slice(self, column: array, first: int) -> array:
+        # Логическое окно [first, count) - не больше двух непрерывных кусков массива
+        if first >= self.count:
+            return column[0:0]
+        start = self._physical(first)
+        end = self._physical(self.count - 1) + 1
+        if start < end:
+            return column[start:end]
+        return column[start:] + column[:end]
+
+    def window(self, since: float) -> tuple[array, array]:
+        first = self._lower_bound(since)
+        return self._slice(self.ts, first), self._slice(self.values, first)
+
+    def stats(self, since: float, points: int = 12) -> dict | None:
+        ts, values = self.window(since)
+        if not values:
+            return None
+        if numpy is not None:
+            return _stats_numpy(ts, values, points)
+        return _stats_array(ts, values, points)
+
+
+# ---------- История дома ----------
+# Отдельный буфер на каждый датчик; пропущенное показание просто не записывается.
+# Показания чаще min_interval прореживаются, чтобы частый опрос не сокращал
+# глубину истории.
+class SensorHistory:
+    def __init__(self, sensors: tuple[str, ...], capacity: int, min_interval: float = 0):
+        self.sensors = sensors
+        self.min_interval = min_interval
+        self.buffers = {sensor: RingBuffer(capacity) for sensor in sensors}
+
+    def append(self, ts: float, readings: dict[str, float | None]):
+        for sensor, buffer in self.buffers.items():
+            value = readings.get(sensor)
+            if value is None:
+                continue
+            last = buffer.last_ts()
+            if last is None or ts - last >= self.min_interval:
+                buffer.append(ts, value)
+
+    def stats(self, sensor: str, since: float, points: int = 12) -> dict | None:
+        return self.buffers[sensor].stats(since, points)
+
+
+def _stats_numpy(ts: array, values: array, points: int) -> dict:
+    ts = numpy.frombuffer(ts, dtype=numpy.float64)
+    values = numpy.frombuffer(values, dtype=numpy.float32)
+
+    # Усреднение по равным интервалам времени: границы корзин через searchsorted
+    edges = numpy.linspace(ts[0], ts[-1], points + 1)[:-1]
+    starts = numpy.unique(numpy.searchsorted(ts, edges))
+    sums = numpy.add.reduceat(values, starts, dtype=numpy.float64)
+    counts = numpy.diff(numpy.append(starts, len(values)))
+    return {
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "avg": float(values.mean(dtype=numpy.float64)),
+        "count": int(len(values)),
+        "series": (sums / counts).tolist(),
+    }
+
+
+def _stats_array(ts: array, values: array, points: int) -> dict:
+    # Без numpy: min/max/sum по срезам array считаются в C, без списков объектов
+    first, last = ts[0], ts[-1]
+    step = (last - first) / points or 1
+    series, start = [], 0
+    for k in range(1, points + 1):
+        end = len(ts) if k == points else bisect_left(ts, first + step * k, start)
+        if end > start:
+            series.append(sum(values[start:end]) / (end - start))
+        start = end
+    return {
+        "min": min(values),
+        "max": max(values),
+        "avg": sum(values) / len(values),
+        "count": len(values),
+        "series": series,
+    }
+
+
+# ---------- Форматирование ----------
+def sparkline(series: list[float]) -> str:
+    if not series:
+        return ""
+    low, high = min(series), max(series)
+    span = high - low or 1
+    return "".join(SPARK_BARS[int((v - low) / span * (len(SPARK_BARS) - 1))] for v in series)
+
+
+def parse_window(text: str) -> float | None:
+    # "30m", "6h", "2d" -> секунды
+    units = {"m": 60, "h": 3600, "d": 86400}
+    if len(text) < 2 or text[-1] not in units or not text[:-1].isdigit():
+        return None
+    return int(text[:-1]) * units[text[-1]]
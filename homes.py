@@ -0,0 +1,128 @@
+import asyncio
+import json
+import logging
+import os
+import secrets
+from collections.abc import Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from anomaly import GasAnomalyDetector
+from controller import ControllerClient
+from history import SensorHistory
+from shadow import DeviceShadow
+from subscribers import SubscriberRegistry
+
+
+logger = logging.getLogger(__name__)
+
+# Датчики, чьи показания копятся в истории дома
+HISTORY_SENSORS = ("last_temp", "last_hum", "last_mq2", "last_ldr")
+
+
+# ---------- Дом ----------
+# Дом - это один контроллер со своим пулом соединений, историей показаний,
+# детектором роста газа и тенью исполнительных элементов.
+# Все хендлеры работают с контроллером того дома, к которому привязан чат.
+class Home:
+    def __init__(
+        self,
+        home_id: str,
+        url: str,
+        *,
+        name: str | None = None,
+        key: str | None = None,
+        history_capacity: int = 2880,
+        history_interval: float = 0,
+        shadow_min_interval: float = 2,
+        shadow_max_interval: float = 60,
+        gas_options: dict | None = None,
+        **client_options,
+    ):
+        self.id = home_id
+        self.name = name or home_id
+        self.key = key
+        self.controller = ControllerClient(url, **client_options)
+        self.history = SensorHistory(HISTORY_SENSORS, history_capacity, history_interval)
+        self.gas = GasAnomalyDetector(**(gas_options or {}))
+        self.shadow = DeviceShadow(self.controller, min_interval=shadow_min_interval, max_interval=shadow_max_interval)
+
+    def __repr__(self) -> str:
+        return f"Home({self.id!r}, {self.controller.base_url!r})"
+
+    def check_key(self, key: str | None) -> bool:
+        # Дом без ключа (только дом по умолчанию) открыт всем; сравнение - за постоянное время
+        if self.key is None:
+            return True
+        return key is not None and secrets.compare_digest(key.encode(), self.key.encode())
+
+
+# ---------- Реестр домов ----------
+class HomeRegistry:
+    def __init__(self, subscribers: SubscriberRegistry, default_home: str):
+        self.subscribers = subscribers
+        self.default_home = default_home
+        self._homes: dict[str, Home] = {}
+
+    def add(self, home: Home):
+        self._homes[home.id] = home
+
+    def load(self, path: str, **options):
+        # Файл вида {"home_id": {"url": "...", "name": "...", "key": "..."}}. Ключ
+        # обязателен: без него к дому мог бы привязаться и управлять им кто угодно
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        loaded = 0
+        for home_id, entry in config.items():
+            if not entry.get("key"):
+                logger.error(f"[HOMES] Дом {home_id} пропущен: в {path} не задан ключ")
+                continue
+            self.add(Home(home_id, entry["url"], name=entry.get("name"), key=entry["key"], **options))
+            loaded += 1
+        logger.info(f"[HOMES] Из {path} загружено домов: {loaded}")
+
+    def __iter__(self):
+        return iter(self._homes.values())
+
+    def __len__(self) -> int:
+        return len(self._homes)
+
+    def get(self, home_id: str) -> Home | None:
+        return self._homes.get(home_id)
+
+    def for_chat(self, chat_id: int) -> Home:
+        return self._homes.get(self.subscribers.home_of(chat_id)) or self._homes[self.default_home]
+
+    async def start(self):
+        await asyncio.gather(*(home.controller.start() for home in self))
+
+    async def close(self):
+        await asyncio.gather(*(home.controller.close() for home in self))
+
+
+# ---------- Подстановка дома в хендлеры ----------
+class HomeMiddleware(BaseMiddleware):
+    def __init__(self, homes: HomeRegistry):
+        self.homes = homes
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict], Awaitable],
+        event: TelegramObject,
+        data: dict,
+    ):
+        if isinstance(event, Message):
+            chat_id = event.chat.id
+        elif isinstance(event, CallbackQuery) and event.message is not None:
+            chat_id = event.message.chat.id
+        else:
+            chat_id = None
+
+        if chat_id is not None:
+            home = self.homes.for_chat(chat_id)
+            data["home"] = home
+            data["controller"] = home.controller
+        return await handler(event, data)
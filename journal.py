@@ -0,0 +1,165 @@
+import logging
+import mmap
+import os
+import struct
+from bisect import bisect_right
+from dataclasses import dataclass
+
+
+logger = logging.getLogger(__name__)
+
+# Запись: время, номер события (-1 - неизвестен), длины id дома и события, затем сами строки
+HEADER = struct.Struct("<dqHH")
+# Запись разреженного индекса: время записи и её смещение в сегменте
+INDEX = struct.Struct("<dQ")
+
+
+@dataclass
+class JournalRecord:
+    ts: float
+    home_id: str
+    value: str
+    seq: int | None = None
+
+
+# ---------- Журнал событий ----------
+# События дописываются в конец текущего сегмента seg-<время первой записи>.log.
+# Каждая index_every-я запись попадает в разреженный индекс .idx рядом с
+# сегментом, поэтому запрос за период открывает только нужные сегменты,
+# находит в индексе ближайшее смещение и читает файл через mmap с этого места.
+# Сегмент закрывается, когда дорастает до segment_size байт.
+class EventJournal:
+    def __init__(self, path: str, *, segment_size: int = 4 * 1024 * 1024, index_every: int = 64):
+        self.path = path
+        self.segment_size = segment_size
+        self.index_every = index_every
+        self._segments: list[float] = []
+        self._log = None
+        self._idx = None
+        self._size = 0
+        self._count = 0
+
+    # ---------- Открытие и восстановление ----------
+    def open(self):
+        os.makedirs(self.path, exist_ok=True)
+        self._segments = self._scan()
+        if self._segments:
+            self._open_segment(self._segments[-1])
+        logger.info(f"[JOURNAL] {self.path}: сегментов {len(self._segments)}")
+
+    def close(self):
+        for f in (self._log, self._idx):
+            if f is not None:
+                f.close()
+        self._log = self._idx = None
+
+    def _scan(self) -> list[float]:
+        if not os.path.isdir(self.path):
+            return []
+        starts = []
+        for name in os.listdir(self.path):
+            if name.startswith("seg-") and name.endswith(".log"):
+                starts.append(int(name[4:-4]) / 1000)
+        return sorted(starts)
+
+    def _segment_path(self, start: float, ext: str) -> str:
+        return os.path.join(self.path, f"seg-{int(start * 1000):016d}.{ext}")
+
+    def _open_segment(self, start: float):
+        self.close()
+        log_path = self._segment_path(start, "log")
+        # Хвост мог остаться недописанным после аварийной остановки - отрезаем его
+        if os.path.exists(log_path):
+            size, count = self._valid_length(log_path)
+            os.truncate(log_path, size)
+        else:
+            size = count = 0
+        self._log = open(log_path, "ab")
+        self._idx = open(self._segment_path(start, "idx"), "ab")
+        self._size = size
+        self._count = count
+
+    @staticmethod
+    def _valid_length(log_path: str) -> tuple[int, int]:
+        offset = count = 0
+        with open(log_path, "rb") as f:
+            data = f.read()
+        while offset + HEADER.size <= len(data):
+            _, _, home_len, value_len = HEADER.unpack_from(data, offset)
+            end = offset + HEADER.size + home_len + value_len
+            if end > len(data):
+                break
+            offset = end
+            count += 1
+        return offset, count
+
+    # ---------- Запись ----------
+    def append(self, ts: float, home_id: str, value: str, seq: int | None = None):
+        home = home_id.encode()
+        text = value.encode()
+        record = HEADER.pack(ts, -1 if seq is None else seq, len(home), len(text)) + home + text
+
+        if self._log is None or (self._size and self._size + len(record) > self.segment_size):
+            self._segments.append(ts)
+            self._open_segment(ts)
+
+        if self._count % self.index_every == 0:
+            self._idx.write(INDEX.pack(ts, self._size))
+            self._idx.flush()
+        self._log.write(record)
+        self._log.flush()
+        self._size += len(record)
+        self._count += 1
+
+    # ---------- Чтение ----------
+    def query(
+        self,
+        since: float,
+        until: float | None = None,
+        *,
+        home_id: str | None = None,
+        limit: int | None = None,
+    ) -> list[JournalRecord]:
+        # Последние limit событий за [since, until], в порядке времени
+        segments = self._segments if self._log is not None else self._scan()
+        first = max(bisect_right(segments, since) - 1, 0)
+        records: list[JournalRecord] = []
+        for i in range(first, len(segments)):
+            if until is not None and segments[i] > until:
+                break
+            records.extend(self._read_segment(segments[i], since, until, home_id))
+        return records[-limit:] if limit else records
+
+    def _read_segment(self, start: float, since: float, until: float | None, home_id: str | None):
+        offset = self._seek(start, since)
+        with open(self._segment_path(start, "log"), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= offset:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                while offset + HEADER.size <= size:
+                    ts, seq, home_len, value_len = HEADER.unpack_from(data, offset)
+                    body = offset + HEADER.size
+                    offset = body + home_len + value_len
+                    if offset > size:
+                        break
+                    if until is not None and ts > until:
+                        break
+                    if ts < since:
+                        continue
+                    home = data[body:body + home_len].decode()
+                    if home_id is not None and home != home_id:
+                        continue
+                    value = data[body + home_len:offset].decode()
+                    yield JournalRecord(ts, home, value, None if seq < 0 else seq)
+
+    def _seek(self, start: float, since: float) -> int:
+        # Смещение последней проиндексированной записи не позже since
+        try:
+            with open(self._segment_path(start, "idx"), "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return 0
+        entries = [INDEX.unpack_from(raw, i) for i in range(0, len(raw) - INDEX.size + 1, INDEX.size)]
+        pos = bisect_right([ts for ts, _ in entries], since) - 1
+        return entries[pos][1] if pos >= 0 else 0
@@ -0,0 +1,27 @@
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+
+# ---------- Inline-клавиатуры ----------
+# Клавиатуры собираются один раз при импорте и дальше только отдаются:
+# хендлер не создаёт десяток pydantic-объектов на каждое нажатие. Готовые
+# клавиатуры никто не меняет - они общие для всех чатов.
+def menu(*buttons: tuple[str, str]) -> InlineKeyboardMarkup:
+    # По кнопке в ряд, как во всех меню бота
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text=text, callback_data=data)] for text, data in buttons]
+    )
+
+
+MAIN_MENU = menu(
+    ("Рекомендации по одежде", "menu_weather"),
+    ("Переключить режим", "menu_mode"),
+    ("Опрос датчиков", "menu_state"),
+    ("Сменить код сигнализации", "menu_code"),
+    ("Настройки оповещений", "menu_alerts"),
+)
+
+MANUAL_MENU = menu(
+    ("Выйти из ручного режима", "exit_manual"),
+    ("Опрос состояния", "check_state_manual"),
+    ("Задать значение исполнительному элементу", "set_element_manual"),
+)
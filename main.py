@@ -1,6 +1,10 @@
 import asyncio
 import logging
-import aiohttp
+import os
+import secrets
+import signal
+import time
+from functools import lru_cache, partial
 
 
 from aiogram import Bot, Dispatcher
@@ -8,326 +12,528 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram import Router, F
 from aiogram.fsm.context import FSMContext
-from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
 from aiogram.fsm.state import State, StatesGroup
 
+from actuators import CONTROLS, Action
+from controller import REQUEST_LATENCY, ControllerClient
+from dashboard import DashboardRegistry
+from events import ControllerEvent, EventDeduplicator, EventStream
+from homes import HISTORY_SENSORS, Home, HomeMiddleware, HomeRegistry
+from history import parse_window, sparkline
+from journal import EventJournal
+from keyboards import MAIN_MENU, MANUAL_MENU, menu
+from metrics import HANDLER_LATENCY, REGISTRY, HandlerTimingMiddleware, serve_metrics
+from outbound import OutboundQueue, Priority
+from outbox import Outbox, OutboxEntry
+from scheduler import POLL_DURATION, PollScheduler, PollSpec
+from shadow import ACTUATORS
+from storage import SQLiteStorage
+from supervisor import Supervisor
+from subscribers import SubscriberRegistry
+from templates import render_recommendation, render_state
+from webhook import build_app, run_workers, serve
+from models import StateSnapshot
+
 
 # ---------- Адрес сервера ----------
 SERVER_URL = "https://seasonally-fulfilled-raccoon.cloudpub.ru"
 
-# ---------- Токен бота ----------
-bot_token = ""
-
-# ---------- Задержка для сигнализации ----------
-alarm_delay = 10
-
-# ---------- Чат по умолчанию ----------
-default_chat_id = 0
-
-# ---------- Маршрутизация ----------
-router = Router()
-
-# ---------- Фоновые оповещения ----------
-task = None
-
-
-# ---------- Классы для FSM ----------
-class AlarmStates(StatesGroup):
-    waiting_for_code = State()
-
-class AlarmCheckStates(StatesGroup):
-    waiting_for_alarm_code = State()
-
-class CheckStates(StatesGroup):
-    checking_for_alarm_code = State()
-
-class ManualControl(StatesGroup):
-    choosing_element = State()
-    choosing_led_color = State()
-    choosing_window = State()
-    choosing_buzzer = State()
-    choosing_alarm = State()
-
-
-# ---------- Post-запросы ----------
-async def set_alarm_code(new_code: str) -> bool:
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f"{SERVER_URL}/set/alarm_code", json={"alarm_code": new_code}) as r:
-            return r.status == 200
-
-
-async def set_window_open(is_open: bool) -> bool:
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f"{SERVER_URL}/set/window_open", json={"window_open": is_open}) as r:
-            return r.status == 200
-
-
-async def set_control_mode(mode: str) -> bool:
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f"{SERVER_URL}/set/control_mode", json={"control_mode": mode}) as r:
-            return r.status == 200
-
-
-async def set_alarm_active(active: bool) -> bool:
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f"{SERVER_URL}/set/alarm_active", json={"alarm_active": active}) as r:
-            return r.status == 200
-
-
-async def set_buzzer_active(active: bool) -> bool:
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f"{SERVER_URL}/set/buzzer_active", json={"buzzer_active": active}) as r:
-            return r.status == 200
-
-
-async def set_led_color(color: str) -> bool:
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f"{SERVER_URL}/set/led_color", json={"led_color": color}) as r:
-            return r.status == 200
+# ---------- Дома: контроллер по умолчанию и файл с остальными ----------
+default_home_id = "default"
+homes_file = "homes.json"
+
+# ---------- Сколько опросов контроллеров идёт одновременно ----------
+home_poll_slots = 32
+
+# ---------- Пул соединений с контроллером ----------
+controller_pool_limit = 10
+controller_keepalive = 30
+controller_timeout = 3
+
+# ---------- Окно склейки команд исполнительным элементам (сек) ----------
+controller_write_window = 0.05
+
+# ---------- Сверка тени устройства: чаще после команд, реже при покое (сек) ----------
+shadow_min_interval = 2
+shadow_max_interval = 60
+
+# ---------- Повторы запросов и предохранитель контроллера ----------
+controller_retries = 2
+breaker_threshold = 3
+breaker_reset = 15
+
+# ---------- Время жизни кэша значений контроллера (сек) ----------
+controller_cache_ttls = {
+    "pir_motion": 1,
+    "inside_presence": 2,
+    "last_mq2": 2,
+    "last_ldr": 5,
+    "last_temp": 10,
+    "last_hum": 10,
+    "led_color": 5,
+    "window_open": 5,
+    "buzzer_active": 5,
+    "alarm_active": 5,
+    "control_mode": 30,
+    "alarm_code": 60,
+}
+controller_cache_size = 256
 
+# ---------- Токен бота ----------
+bot_token = os.getenv("BOT_TOKEN", "")
 
-# ---------- Get-запросы ----------
-async def get_alarm_code() -> str | None:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{SERVER_URL}/get/alarm_code") as r:
-            if r.status == 200:
-                return (await r.json())["value"]
+# ---------- Кому доступна команда /stats ----------
+ADMIN_IDS: set[int] = set()
 
+# ---------- Метрики: сбор и локальный эндпоинт для Prometheus (порт + номер процесса) ----------
+metrics_enabled = False
+metrics_host = "127.0.0.1"
+metrics_port = 9100
 
-async def get_event() -> str | None:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{SERVER_URL}/get/event") as r:
-            if r.status == 200:
-                return (await r.json())["value"]
+# ---------- Режим работы: "polling" или "webhook" ----------
+run_mode = "polling"
 
+# ---------- Вебхук: публичный адрес, путь, секрет и локальный сервер ----------
+webhook_base_url = "https://example.cloudpub.ru"
+webhook_path = "/telegram/webhook"
+# Без секрета чужие запросы на адрес вебхука не отличить от Telegram: если он
+# не задан, при запуске генерируется случайный (общий для всех процессов)
+webhook_secret = os.getenv("WEBHOOK_SECRET", "")
+webapp_host = "0.0.0.0"
+webapp_port = 8080
+webhook_workers = 1
 
-async def get_pir_motion() -> bool | None:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{SERVER_URL}/get/pir_motion") as r:
-            if r.status == 200:
-                return (await r.json())["value"]
+# Сколько процессов обрабатывают обновления
+worker_count = webhook_workers if run_mode == "webhook" else 1
 
+# ---------- Задержка для сигнализации ----------
+alarm_delay = 10
 
-async def get_inside_presence() -> bool | None:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{SERVER_URL}/get/inside_presence") as r:
-            if r.status == 200:
-                return (await r.json())["value"]
+# ---------- Интервал опроса событий, если контроллер не поддерживает push ----------
+event_poll_interval = 1
+
+# ---------- План опроса: обычный период, предел замедления (сек) и приоритет ----------
+poll_plan = {
+    "event": PollSpec(event_poll_interval, 5, priority=0, idle_backoff=False),
+    "control_mode": PollSpec(10, 60, priority=0),
+    "last_mq2": PollSpec(5, 30, priority=0),
+    "pir_motion": PollSpec(5, 30, priority=1),
+    "inside_presence": PollSpec(10, 120, priority=1),
+    "last_ldr": PollSpec(30, 300, priority=2),
+    "last_temp": PollSpec(30, 300, priority=2),
+    "last_hum": PollSpec(30, 300, priority=2),
+}
+# Пока перед домом движение, его ключи опрашиваются вдвое чаще
+poll_boost_duration = 60
+
+# ---------- Подавление повторных событий и склейка пачек (сек) ----------
+event_repeat_window = 30
+event_burst_window = 2
+
+# ---------- История показаний: шаг записи (сек) и глубина (24 часа) ----------
+history_interval = 30
+history_capacity = 24 * 3600 // history_interval
+history_points = 24
+
+# ---------- Раннее предупреждение о газе (по каждому опросу MQ2) ----------
+gas_detector = dict(z_threshold=4, rate_threshold=30, warmup=10, cooldown=600)
+
+# ---------- Ограничения исходящих сообщений (лимиты Telegram) ----------
+outbound_global_rate = 25
+outbound_chat_rate = 1
+outbound_workers = 8
+outbound_merge = True
+
+# ---------- База подписчиков на оповещения ----------
+subscribers_db = "subscribers.sqlite3"
+
+# ---------- Живые панели состояния: как часто перерисовывать и как часто можно править (сек) ----------
+dashboard_interval = 2
+dashboard_edit_interval = 5
+
+# ---------- Отложенные команды контроллерам: база и пауза между попытками доставки (сек) ----------
+outbox_db = "outbox.sqlite3"
+outbox_retry_interval = 5
+
+# ---------- Хранилище состояний FSM (переживает перезапуск) ----------
+fsm_db = "fsm.sqlite3"
+fsm_flush_interval = 0.5
+fsm_cache_size = 10000
+
+# ---------- Журнал событий: каталог, размер сегмента, сколько событий показывать ----------
+journal_dir = "events"
+journal_segment_size = 4 * 1024 * 1024
+journal_limit = 50
+
+# ---------- Перезапуск упавших фоновых задач: пауза от и до (сек) ----------
+supervisor_restart_min = 1
+supervisor_restart_max = 60
 
+# ---------- Маршрутизация ----------
+router = Router()
 
-async def get_last_mq2() -> int | None:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{SERVER_URL}/get/last_mq2") as r:
-            if r.status == 200:
-                return (await r.json())["value"]
+# ---------- Фоновые задачи: информаторы, планировщик опроса, сверка теней ----------
+supervisor = Supervisor(restart_min=supervisor_restart_min, restart_max=supervisor_restart_max)
 
+# ---------- Журнал событий (пишет процесс с информаторами, читают все) ----------
+journal = EventJournal(journal_dir, segment_size=journal_segment_size)
 
-async def get_last_ldr() -> int | None:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{SERVER_URL}/get/last_ldr") as r:
-            if r.status == 200:
-                return (await r.json())["value"]
+# ---------- Очередь исходящих сообщений (создаётся в main) ----------
+outbound: OutboundQueue | None = None
 
+# ---------- Подписчики на оповещения (открываются в main) ----------
+subscribers = SubscriberRegistry(subscribers_db, default_home_id, shared=worker_count > 1)
 
-async def get_last_temp() -> int | None:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{SERVER_URL}/get/last_temp") as r:
-            if r.status == 200:
-                return (await r.json())["value"]
+# ---------- Закреплённые панели состояния (открываются в main) ----------
+dashboards = DashboardRegistry(subscribers_db, min_interval=dashboard_edit_interval, shared=worker_count > 1)
 
+# ---------- Команды, которые контроллер не принял (открываются в main) ----------
+outbox = Outbox(outbox_db, retry_interval=outbox_retry_interval, slots=home_poll_slots, shared=worker_count > 1)
 
-async def get_last_hum() -> int | None:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{SERVER_URL}/get/last_hum") as r:
-            if r.status == 200:
-                return (await r.json())["value"]
+# ---------- Дома (заполняются в main) ----------
+homes = HomeRegistry(subscribers, default_home_id)
+poll_slots = asyncio.Semaphore(home_poll_slots)
 
+# ---------- HTTP-сервер метрик (создаётся в main, если метрики включены) ----------
+metrics_runner = None
 
-async def get_window_open() -> bool | None:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{SERVER_URL}/get/window_open") as r:
-            if r.status == 200:
-                return (await r.json())["value"]
+# ---------- Планировщик опроса и потоки событий домов (создаются в main) ----------
+scheduler: PollScheduler | None = None
+event_streams: dict[str, EventStream] = {}
+router.message.middleware(HomeMiddleware(homes))
+router.callback_query.middleware(HomeMiddleware(homes))
+router.message.middleware(HandlerTimingMiddleware())
+router.callback_query.middleware(HandlerTimingMiddleware())
 
+# ---------- Метрики, которые снимаются в момент запроса ----------
+REGISTRY.enabled = metrics_enabled
+REGISTRY.collector("event_loop_lag_seconds", "Задержка цикла событий", lambda: supervisor.lag)
+REGISTRY.collector(
+    "outbound_queue_depth", "Сообщений в очереди", lambda: outbound.depth() if outbound else {}, labelnames=("priority",)
+)
+REGISTRY.collector("outbound_sent_total", "Отправлено сообщений", lambda: outbound.sent if outbound else 0, "counter")
+REGISTRY.collector("outbound_failed_total", "Не отправлено сообщений", lambda: outbound.failed if outbound else 0, "counter")
+REGISTRY.collector("outbound_retried_total", "Повторных отправок", lambda: outbound.retried if outbound else 0, "counter")
+REGISTRY.collector("outbound_edited_total", "Правок сообщений", lambda: outbound.edited if outbound else 0, "counter")
+REGISTRY.collector("outbox_pending", "Отложенных команд контроллерам", lambda: len(outbox))
+REGISTRY.collector("outbox_replayed_total", "Доставлено отложенных команд", lambda: outbox.replayed, "counter")
+REGISTRY.collector("outbox_rejected_total", "Отложенных команд, отклонённых контроллером", lambda: outbox.rejected, "counter")
+REGISTRY.collector(
+    "controller_cache_hits_total", "Чтений из кэша контроллеров", lambda: sum(h.controller.cache.hits for h in homes), "counter"
+)
+REGISTRY.collector(
+    "controller_cache_misses_total", "Промахов кэша контроллеров", lambda: sum(h.controller.cache.misses for h in homes), "counter"
+)
+REGISTRY.collector("dashboard_skipped_total", "Обновлений панелей без изменений", lambda: dashboards.skipped, "counter")
 
-async def get_control_mode() -> str | None:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{SERVER_URL}/get/control_mode") as r:
-            if r.status == 200:
-                return (await r.json())["value"]
 
+# ---------- Классы для FSM ----------
+class AlarmStates(StatesGroup):
+    waiting_for_code = State()
 
-async def get_alarm_active() -> bool | None:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{SERVER_URL}/get/alarm_active") as r:
-            if r.status == 200:
-                return (await r.json())["value"]
+class AlarmCheckStates(StatesGroup):
+    waiting_for_alarm_code = State()
 
+class CheckStates(StatesGroup):
+    checking_for_alarm_code = State()
 
-async def get_buzzer_active() -> bool | None:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{SERVER_URL}/get/buzzer_active") as r:
-            if r.status == 200:
-                return (await r.json())["value"]
 
+# ---------- Отправка текстовых сообщений без маркеров ----------
+# Сообщение ставится в очередь; ошибки доставки логирует сама очередь
+async def send_text(text: str, chat_id: int, priority: Priority = Priority.NORMAL):
+    outbound.send(chat_id, text, priority=priority)
+
+
+# ---------- Отправка сообщений с клавиатурой ----------
+async def send_message(chat_id: int, text: str, **kwargs):
+    outbound.send(chat_id, text, **kwargs)
+
+
+# ---------- Правка уже отправленного сообщения на месте ----------
+async def edit_message(message: Message, text: str, **kwargs):
+    outbound.edit(message.chat.id, message.message_id, text, **kwargs)
+
+
+# ---------- Команды контроллеру, которые не теряются ----------
+QUEUED_TEXT = "⏳ Контроллер недоступен. Команда сохранена и будет выполнена, когда связь восстановится."
+REJECTED_TEXT = "❌ Контроллер отклонил команду."
+
+COMMAND_TITLES = {
+    "led_color": "Цвет освещения",
+    "window_open": "Окно открыто",
+    "buzzer_active": "Пищалка включена",
+    "alarm_active": "Сигнализация включена",
+    "control_mode": "Режим управления",
+    "alarm_code": "Код сигнализации",
+}
+
+
+async def apply_command(home: Home, key: str, value, chat_id: int | None = None) -> bool | None:
+    # True - контроллер принял команду, None - она отложена до восстановления связи,
+    # False - контроллер на связи, но команду отклонил (откладывать её бессмысленно).
+    # Пока у дома есть отложенные команды, новые встают за ними, чтобы не обогнать
+    if not outbox.has(home.id):
+        if key in ACTUATORS:
+            ok = await home.shadow.set(key, value)
+        else:
+            ok = await home.controller.set(key, value)
+        if ok is not None:
+            return ok
+    await outbox.put(home.id, key, value, chat_id)
+    outbox.wake()
+    return None
 
-async def get_led_color() -> str | None:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{SERVER_URL}/get/led_color") as r:
-            if r.status == 200:
-                return (await r.json())["value"]
 
+def command_status(applied: bool | None) -> str | None:
+    # Что сказать пользователю о невыполненной команде
+    if applied:
+        return None
+    return REJECTED_TEXT if applied is False else QUEUED_TEXT
 
-# ---------- Отправка текстовых сообщений без маркеров ----------
-async def send_text(text: str, chat_id: int = None):
-    if chat_id is None:
-        chat_id = default_chat_id
 
-    try:
-        await bot.send_message(chat_id=chat_id, text=text)
-        logger.info(f"[BOT] Sent: {text}")
-    except Exception as e:
-        logger.error(f"[BOT] Error sending message: {e}")
+def describe_command(entry: OutboxEntry) -> str:
+    if entry.key == "alarm_code":
+        value = "изменён"
+    elif isinstance(entry.value, bool):
+        value = "да" if entry.value else "нет"
+    else:
+        value = entry.value
+    return f"• {COMMAND_TITLES.get(entry.key, entry.key)}: {value}"
+
+
+async def notify_replayed(home_id: str, done: list[OutboxEntry], rejected: list[OutboxEntry]):
+    # Авторам отложенных команд сообщаем, что они наконец выполнены или отклонены
+    per_chat: dict[int, tuple[list[OutboxEntry], list[OutboxEntry]]] = {}
+    for entries, index in ((done, 0), (rejected, 1)):
+        for entry in entries:
+            if entry.chat_id is not None:
+                per_chat.setdefault(entry.chat_id, ([], []))[index].append(entry)
+    for chat_id, (chat_done, chat_rejected) in per_chat.items():
+        parts = ["✅ Связь с контроллером восстановлена."]
+        if chat_done:
+            parts.append("Отложенные команды выполнены:\n" + "\n".join(describe_command(entry) for entry in chat_done))
+        if chat_rejected:
+            parts.append("Контроллер отклонил:\n" + "\n".join(describe_command(entry) for entry in chat_rejected))
+        await send_text("\n\n".join(parts), chat_id)
+        home = homes.get(home_id)
+        if home is not None:
+            refresh_dashboard(chat_id, home)
+
+
+def outbox_writer(home_id: str):
+    home = homes.get(home_id)
+    return home.controller.write_ordered if home is not None else None
 
 
 # ---------- Рекомендации одежды ----------
-async def send_clothing_recommendation(chat_id: int):
-    temp = await get_last_temp()
-    hum = await get_last_hum()
-
-    if temp < 10 and hum > 70:
-        text = (
-            f"🌡 Температура: {temp}°C\n💧 Влажность: {hum}%\n\n"
-            "Очень холодно и влажно. Рекомендую тёплую куртку, "
-            "водонепроницаемую обувь и головной убор. "
-            "Влажность повышена, охлаждение усиливается."
-        )
+async def send_clothing_recommendation(controller: ControllerClient, chat_id: int):
+    temp, hum = await asyncio.gather(controller.get_last_temp(), controller.get_last_hum())
+    await send_text(render_recommendation(temp, hum), chat_id)
 
-    elif temp < 10 and hum <= 70:
-        text = (
-            f"🌡 Температура: {temp}°C\n💧 Влажность: {hum}%\n\n"
-            "Холодно, но влажность в норме. Возьми тёплую куртку "
-            "и перчатки. Основной фактор — низкая температура."
-        )
-
-    elif 10 <= temp < 20 and hum > 70:
-        text = (
-            f"🌡 Температура: {temp}°C\n💧 Влажность: {hum}%\n\n"
-            "Прохладно и влажно. Возьми лёгкую куртку. "
-            "Высокая влажность делает воздух холоднее ощущаемо."
-        )
 
-    elif 10 <= temp < 20 and hum <= 70:
-        text = (
-            f"🌡 Температура: {temp}°C\n💧 Влажность: {hum}%\n\n"
-            "Прохладно, влажность нормальная. Подойдёт кофта или ветровка. "
-            "Условия комфортные."
-        )
-
-    elif temp >= 20 and hum > 70:
-        text = (
-            f"🌡 Температура: {temp}°C\n💧 Влажность: {hum}%\n\n"
-            "Тепло, но влажность повышена. Рекомендую лёгкую одежду, "
-            "дышащие ткани. Влажность делает воздух душным."
-        )
+# ---------- Inline-клавиатуры ----------
+# Главное меню и меню ручного режима собраны заранее (keyboards.py); клавиатура
+# оповещений зависит только от набора включённых категорий, поэтому на каждый
+# набор собирается один раз
+@lru_cache(maxsize=64)
+def alerts_menu(enabled: frozenset[str]) -> InlineKeyboardMarkup:
+    return menu(*(
+        (f"{'✅' if category in enabled else '❌'} {title}", f"alerts_{category}")
+        for category, title in ALERT_CATEGORIES.items()
+    ))
 
-    else:
-        text = (
-            f"🌡 Температура: {temp}°C\n💧 Влажность: {hum}%\n\n"
-            "Тепло и комфортно. Можно надевать обычную лёгкую одежду. "
-            "Показатели в норме."
-        )
 
-    await send_text(text, chat_id)
+ALERTS_TEXT = "Оповещения каких категорий присылать в этот чат:"
 
 
-# ---------- Inline-клавиатуры ----------
-def main_menu_kb():
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="Рекомендации по одежде", callback_data="menu_weather"),
-            ],
-            [
-                InlineKeyboardButton(text="Переключить режим", callback_data="menu_mode"),
-            ],
-            [
-                InlineKeyboardButton(text="Опрос датчиков", callback_data="menu_state"),
-            ],
-            [
-                InlineKeyboardButton(text="Сменить код сигнализации", callback_data="menu_code"),
-            ]
-        ]
-    )
+def alerts_kb(chat_id: int) -> InlineKeyboardMarkup:
+    return alerts_menu(frozenset(c for c in ALERT_CATEGORIES if subscribers.wants(chat_id, c)))
 
 
-async def manual_mode_menu():
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="Выйти из ручного режима", callback_data="exit_manual"),
-            ],
-            [
-                InlineKeyboardButton(text="Опрос состояния", callback_data="check_state_manual"),
-            ],
-            [
-                InlineKeyboardButton(text="Задать значение исполнительному элементу", callback_data="set_element_manual")
-            ]
-        ]
-    )
+MANUAL_MODE_TEXT = (
+    "Теперь управление ведется в ручном режиме, вам доступно управление каждым элементом по отдельности. "
+    "Выберите, что вы хотите сделать."
+)
 
 
 # ---------- Хендлеры ----------
 @router.message(F.text == "/start")
-async def cmd_start(message: Message):
-    global default_chat_id
+async def cmd_start(message: Message, controller: ControllerClient, home: Home):
+    await subscribers.subscribe(message.chat.id)
 
-    default_chat_id = message.chat.id
-
-    if await get_control_mode() != "auto":
-        await set_control_mode("auto")
-        logger.info("[MODE] Переключено в автоматический режим")
+    applied = True
+    if await controller.get_control_mode() != "auto":
+        applied = await apply_command(home, "control_mode", "auto", message.chat.id)
+        if applied is not False:
+            logger.info(f"[MODE] Переключено в автоматический режим{'' if applied else ' (отложено)'}")
 
     text = (
         "Система умного дома активирована!\n\n"
         "Все системы работают в штатном режиме.\n\n"
         "Режим управления: автоматический\n\n"
-        "Выберите действие:"
+        + ("" if applied else f"{command_status(applied)}\n\n")
+        + "Выберите действие:"
     )
 
-    await message.answer(text, reply_markup=main_menu_kb(), parse_mode="Markdown")
+    await send_message(message.chat.id, text, reply_markup=MAIN_MENU, parse_mode="Markdown")
 
 
 @router.message(F.text == "/weather")
-async def cmd_weather(message: Message):
-    await send_clothing_recommendation(message.chat.id)
+async def cmd_weather(message: Message, controller: ControllerClient):
+    await send_clothing_recommendation(controller, message.chat.id)
 
 
 @router.message(F.text == "/state")
-async def cmd_state(message: Message):
-    text = (
-        "📟 Состояние системы:\n\n"
-        f"💨 Есть кто дома? - {'да' if await get_inside_presence() else 'нет'}\n"
-        f"👣 Есть движение перед домом? - {'да' if await get_pir_motion() else 'нет'}\n"
-        f"📏 Освещенность на улице - {await get_last_ldr()}\n"
-        f"🪟 Уровень газа в доме - {await get_last_mq2()}\n"
-        f"🔐 Температура на улице - {await get_last_temp()}\n"
-        f"📏 Влажность на улице - {await get_last_hum()}\n"
-        f"🪟 Цвет освещения (None - выключено) - {await get_led_color()}\n"
-        f"🔐 Окно открыто? - {'да' if await get_window_open() else 'нет'}\n"
-        f"🛠 Пищалка включена? - {'да' if await get_buzzer_active() else 'нет'}\n"
+async def cmd_state(message: Message, controller: ControllerClient):
+    await show_state(message.chat.id, await controller.get_state_snapshot())
+
+
+# ---------- Живая панель состояния ----------
+def live_snapshot(home: Home) -> StateSnapshot:
+    # Панели рисуются из памяти: последние известные значения плюс ещё не подтверждённые команды
+    controller = home.controller
+    values = {key: controller.last_known(key) for key in StateSnapshot.keys()}
+    values.update(home.shadow.desired)
+    return StateSnapshot(**values, stale=controller.breaker.state != "closed")
+
+
+async def show_state(chat_id: int, snapshot: StateSnapshot) -> bool:
+    # Состояние уже закреплено в чате - обновляем панель, а не шлём новое сообщение.
+    # True - обновлена панель
+    text = render_state(snapshot)
+    if chat_id in dashboards:
+        dashboards.update(chat_id, text)
+        return True
+    await send_text(text, chat_id)
+    return False
+
+
+def refresh_dashboard(chat_id: int, home: Home):
+    if chat_id in dashboards:
+        dashboards.update(chat_id, render_state(live_snapshot(home)))
+
+
+async def watch_dashboards():
+    # Опросы и сверка теней уже держат значения свежими - здесь только перерисовка,
+    # один раз на дом; правки уходят лишь для панелей, у которых поменялся текст
+    while True:
+        await asyncio.sleep(dashboard_interval)
+        texts: dict[str, str] = {}
+        for chat_id in dashboards.chats():
+            home = homes.for_chat(chat_id)
+            if home.id not in texts:
+                texts[home.id] = render_state(live_snapshot(home))
+            dashboards.update(chat_id, texts[home.id])
+
+
+@router.message(F.text.startswith("/dashboard"))
+async def cmd_dashboard(message: Message, controller: ControllerClient):
+    if message.text.split()[1:] == ["off"]:
+        if await dashboards.hide(message.chat.id):
+            await send_text("Панель состояния отключена.", message.chat.id)
+        else:
+            await send_text("Панель состояния не открыта. Открыть: /dashboard", message.chat.id)
+        return
+
+    text = render_state(await controller.get_state_snapshot())
+    if not await dashboards.show(message.chat.id, text):
+        await send_text("Не удалось открыть панель состояния, попробуйте позже.", message.chat.id)
+
+
+def render_stats() -> str:
+    health = supervisor.health()
+    lines = [
+        "📊 Статистика:\n",
+        f"Задержка цикла событий: {health['loop_lag'] * 1000:.0f} мс (макс {health['max_loop_lag'] * 1000:.0f} мс)",
+    ]
+    for name, worker in health["workers"].items():
+        lines.append(f"• {name}: {worker['status']}, перезапусков {worker['restarts']}")
+
+    stats = outbound.stats()
+    lines.append(
+        f"\nИсходящие: отправлено {stats['sent']}, ошибок {stats['failed']}, "
+        f"повторов {stats['retried']}, в очереди {sum(stats['depth'].values())}"
     )
+    lines.append(
+        f"Панели: {len(dashboards.chats())}, правок {stats['edited']} "
+        f"(схлопнуто {stats['coalesced']}), без изменений {dashboards.skipped}"
+    )
+    lines.append(f"Отложенные команды: {len(outbox)}, доставлено {outbox.replayed}, отклонено {outbox.rejected}")
+    hits = sum(home.controller.cache.hits for home in homes)
+    misses = sum(home.controller.cache.misses for home in homes)
+    lines.append(f"Кэш контроллеров: попаданий {hits}, промахов {misses} ({hits / max(hits + misses, 1):.0%})")
+
+    if not REGISTRY.enabled:
+        lines.append("\nПодробные метрики выключены (metrics_enabled)")
+        return "\n".join(lines)
+    for title, histogram in (("Контроллер", REQUEST_LATENCY), ("Хендлеры", HANDLER_LATENCY), ("Опрос", POLL_DURATION)):
+        lines.append(f"\n{title} (p50 / p99, мс):")
+        # Десять самых частых меток, чтобы сообщение не разрасталось
+        top = sorted(histogram.values.items(), key=lambda item: item[1][2], reverse=True)[:10]
+        for labels, (_, _, count) in top:
+            p50, p99 = histogram.quantile(labels, 0.5), histogram.quantile(labels, 0.99)
+            lines.append(f"• {labels[0]}: {p50 * 1000:.0f} / {p99 * 1000:.0f} ({count})")
+    return "\n".join(lines)
+
+
+@router.message(F.text == "/stats")
+async def cmd_stats(message: Message):
+    if message.from_user is None or message.from_user.id not in ADMIN_IDS:
+        return
+    await send_text(render_stats(), message.chat.id)
+
+
+HISTORY_TITLES = {
+    "last_temp": ("temp", "🌡 Температура"),
+    "last_hum": ("hum", "💧 Влажность"),
+    "last_mq2": ("gas", "🪟 Уровень газа"),
+    "last_ldr": ("light", "📏 Освещенность"),
+}
+HISTORY_BY_NAME = {short: sensor for sensor, (short, _) in HISTORY_TITLES.items()}
+
+
+def render_history(home: Home, sensors: list[str], window: float) -> str:
+    since = time.time() - window
+    lines = [f"📈 История за {window / 3600:g} ч:\n"]
+    for sensor in sensors:
+        title = HISTORY_TITLES[sensor][1]
+        stats = home.history.stats(sensor, since, points=history_points)
+        if stats is None:
+            lines.append(f"{title}: нет данных")
+            continue
+        lines.append(
+            f"{title}: мин {stats['min']:.1f} / макс {stats['max']:.1f} / сред {stats['avg']:.1f}\n"
+            f"{sparkline(stats['series'])}"
+        )
+    return "\n".join(lines)
 
-    await send_text(text, message.chat.id)
+
+@router.message(F.text.startswith("/history"))
+async def cmd_history(message: Message, home: Home):
+    # /history [temp|hum|gas|light] [30m|6h|1d]
+    sensors, window = list(HISTORY_SENSORS), 3600
+    for arg in message.text.split()[1:]:
+        if arg in HISTORY_BY_NAME:
+            sensors = [HISTORY_BY_NAME[arg]]
+        elif parse_window(arg) is not None:
+            window = parse_window(arg)
+        else:
+            await send_text("Использование: /history [temp|hum|gas|light] [30m|6h|1d]", message.chat.id)
+            return
+
+    await send_text(render_history(home, sensors, window), message.chat.id)
 
 
 @router.message(F.text == "/mode")
-async def cmd_mode(message: Message, state: FSMContext):
-    if await get_control_mode() == "auto":
-        await go_manual(state)
-        await set_control_mode("manual")
+async def cmd_mode(message: Message, state: FSMContext, controller: ControllerClient, home: Home):
+    if await controller.get_control_mode() == "auto":
+        await go_manual(message.chat.id, state)
+        applied = await apply_command(home, "control_mode", "manual", message.chat.id)
     else:
-        await set_control_mode("auto")
+        applied = await apply_command(home, "control_mode", "auto", message.chat.id)
+    if not applied:
+        await send_text(command_status(applied), message.chat.id)
 
 
 @router.message(F.text == "/code")
@@ -342,38 +548,27 @@ async def cmd_code(message: Message, state: FSMContext):
 
 # ---------- Callback'и для inline-кнопок ----------
 @router.callback_query(F.data == "menu_weather")
-async def cb_weather(callback: CallbackQuery):
-    await send_clothing_recommendation(callback.message.chat.id)
+async def cb_weather(callback: CallbackQuery, controller: ControllerClient):
+    await send_clothing_recommendation(controller, callback.message.chat.id)
 
 
 @router.callback_query(F.data == "menu_mode")
-async def cb_mode(callback: CallbackQuery, state: FSMContext):
-    if await get_control_mode() == "auto":
-        await go_manual(state)
-        await set_control_mode("manual")
+async def cb_mode(callback: CallbackQuery, state: FSMContext, controller: ControllerClient, home: Home):
+    chat_id = callback.message.chat.id
+    if await controller.get_control_mode() == "auto":
+        await go_manual(chat_id, state)
+        applied = await apply_command(home, "control_mode", "manual", chat_id)
     else:
-        await set_control_mode("auto")
+        applied = await apply_command(home, "control_mode", "auto", chat_id)
 
-    await callback.answer()
+    await callback.answer(command_status(applied))
 
 
 @router.callback_query(F.data == "menu_state")
-async def cb_state(callback: CallbackQuery):
-    text = (
-        "📟 Состояние системы:\n\n"
-        f"💨 Есть кто дома? - {'да' if await get_inside_presence() else 'нет'}\n"
-        f"👣 Есть движение перед домом? - : {'да' if await get_pir_motion() else 'нет'}\n"
-        f"📏 Освещенность на улице - {await get_last_ldr()}\n"
-        f"🪟 Уровень газа в доме - {await get_last_mq2()}\n"
-        f"🔐 Температура на улице - {await get_last_temp()}\n"
-        f"📏 Влажность на улице - {await get_last_hum()}\n"
-        f"🪟 Цвет освещения (None - выключено) - {await get_led_color()}\n"
-        f"🔐 Окно открыто? - {'да' if await get_window_open() else 'нет'}\n"
-        f"🛠 Пищалка включена? - {'да' if await get_buzzer_active() else 'нет'}\n"
-    )
-
-    await send_text(text, callback.message.chat.id)
-    await callback.answer()
+async def cb_state(callback: CallbackQuery, controller: ControllerClient):
+    if await show_state(callback.message.chat.id, await controller.get_state_snapshot()):
+        return await callback.answer("Панель состояния обновлена")
+    return await callback.answer()
 
 
 @router.callback_query(F.data == "menu_code")
@@ -387,292 +582,311 @@ async def cb_code(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(F.data == "exit_manual")
-async def exit_manual_mode(callback: CallbackQuery):
-    await set_control_mode("auto")
-    await callback.answer()
-
-
-@router.callback_query(F.data == "check_state_manual")
-async def check_state_manual(callback: CallbackQuery):
-    text = (
-        "📟 Состояние системы:\n\n"
-        f"💨 Есть кто дома? - {'да' if await get_inside_presence() else 'нет'}\n"
-        f"👣 Есть движение перед домом? - : {'да' if await get_pir_motion() else 'нет'}\n"
-        f"📏 Освещенность на улице - {await get_last_ldr()}\n"
-        f"🪟 Уровень газа в доме - {await get_last_mq2()}\n"
-        f"🔐 Температура на улице - {await get_last_temp()}\n"
-        f"📏 Влажность на улице - {await get_last_hum()}\n"
-        f"🪟 Цвет освещения (None - выключено) - {await get_led_color()}\n"
-        f"🔐 Окно открыто? - {'да' if await get_window_open() else 'нет'}\n"
-        f"🛠 Пищалка включена? - {'да' if await get_buzzer_active() else 'нет'}\n"
-    )
-    await send_text(text, callback.message.chat.id)
+@router.callback_query(F.data == "menu_alerts")
+async def cb_alerts(callback: CallbackQuery):
+    await subscribers.subscribe(callback.message.chat.id)
+    await send_message(callback.message.chat.id, ALERTS_TEXT, reply_markup=alerts_kb(callback.message.chat.id))
     await callback.answer()
 
 
-@router.callback_query(F.data == "set_element_manual")
-async def cb_set_element(callback: CallbackQuery, state: FSMContext):
-    await state.set_state(ManualControl.choosing_element)
+@router.callback_query(F.data.startswith("alerts_"))
+async def cb_toggle_alert(callback: CallbackQuery):
+    chat_id = callback.message.chat.id
+    category = callback.data.removeprefix("alerts_")
+    if category not in ALERT_CATEGORIES:
+        return await callback.answer()
 
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="Свет (LED)", callback_data="el_led")],
-            [InlineKeyboardButton(text="Окно (серво)", callback_data="el_window")],
-            [InlineKeyboardButton(text="Пищалка", callback_data="el_buzzer")],
-            [InlineKeyboardButton(text="Сигнализация", callback_data="el_alarm")],
-            [InlineKeyboardButton(text="Отмена", callback_data="el_cancel")]
-        ]
-    )
+    enabled = {c for c in ALERT_CATEGORIES if subscribers.wants(chat_id, c)}
+    enabled ^= {category}
+    await subscribers.set_categories(chat_id, frozenset(enabled))
 
-    await bot.send_message(callback.message.chat.id,
-                           "Выберите исполнительный элемент:",
-                           reply_markup=keyboard)
-    await callback.answer()
+    await edit_message(callback.message, ALERTS_TEXT, reply_markup=alerts_kb(chat_id))
+    return await callback.answer()
 
 
-@router.callback_query(F.data.startswith("el_"), ManualControl.choosing_element)
-async def choose_element(callback: CallbackQuery, state: FSMContext):
-    choice = callback.data
+@router.message(F.text == "/stop")
+async def cmd_stop(message: Message):
+    await subscribers.unsubscribe(message.chat.id)
+    await send_text("Оповещения для этого чата отключены. Чтобы включить их снова, отправьте /start", message.chat.id)
 
-    match choice:
-        case "el_cancel":
-            await state.clear()
-            await bot.send_message(callback.message.chat.id,
-                                   "Теперь управление ведется в ручном режиме, вам доступно управление каждым элементом по отдельности. Выберите, что вы хотите сделать.",
-                                   reply_markup=await manual_mode_menu())
-            return await callback.answer()
 
+@router.message(F.text.startswith("/home"))
+async def cmd_home(message: Message, home: Home):
+    # Список домов не показываем: id и название чужого дома - уже половина доступа
+    args = message.text.split()[1:]
+    if not args:
+        await send_text(
+            f"Этот чат привязан к дому: {home.name}\n\nСменить дом: /home <id> <ключ>",
+            message.chat.id,
+        )
+        return
 
-        case "el_led":
-            await state.set_state(ManualControl.choosing_led_color)
-
-            keyboard = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(text="Красный", callback_data="led_red")],
-                    [InlineKeyboardButton(text="Зеленый", callback_data="led_green")],
-                    [InlineKeyboardButton(text="Синий", callback_data="led_blue")],
-                    [InlineKeyboardButton(text="Жёлтый", callback_data="led_yellow")],
-                    [InlineKeyboardButton(text="Выключить", callback_data="led_off")],
-                    [InlineKeyboardButton(text="Назад", callback_data="led_back")]
-                ]
-            )
+    target = homes.get(args[0])
+    # Один ответ на неизвестный дом и неверный ключ - перебором дома не найти
+    if target is None or not target.check_key(args[1] if len(args) > 1 else None):
+        await send_text("❌ Неверный дом или ключ.", message.chat.id)
+        return
 
-            await bot.send_message(callback.message.chat.id, "Выберите цвет LED:", reply_markup=keyboard)
-            return await callback.answer()
+    await subscribers.bind_home(message.chat.id, target.id)
+    await send_text(f"Чат привязан к дому: {target.name}", message.chat.id)
 
 
-        case "el_window":
-            await state.set_state(ManualControl.choosing_window)
+@router.callback_query(F.data == "exit_manual")
+async def exit_manual_mode(callback: CallbackQuery, home: Home):
+    applied = await apply_command(home, "control_mode", "auto", callback.message.chat.id)
+    await callback.answer(command_status(applied))
 
-            keyboard = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(text="Открыть", callback_data="win_open")],
-                    [InlineKeyboardButton(text="Закрыть", callback_data="win_close")],
-                    [InlineKeyboardButton(text="Назад", callback_data="win_back")]
-                ]
-            )
 
-            await bot.send_message(callback.message.chat.id, "Управление окном:", reply_markup=keyboard)
+@router.callback_query(F.data == "check_state_manual")
+async def check_state_manual(callback: CallbackQuery, home: Home):
+    # Опросы и тень держат значения в памяти (с учётом отданных команд), контроллер
+    # трогаем, только пока о доме ещё ничего не известно
+    if home.shadow.snapshot is not None:
+        snapshot = live_snapshot(home)
+    else:
+        snapshot = await home.controller.get_state_snapshot()
+    if await show_state(callback.message.chat.id, snapshot):
+        return await callback.answer("Панель состояния обновлена")
+    return await callback.answer()
+
+
+# ---------- Ручное управление исполнительными элементами ----------
+# Все кнопки выбора элемента и его значений разбирает один хендлер: фильтр
+# реестра (actuators.py) находит действие по callback_data одним поиском
+@router.callback_query(CONTROLS.match)
+async def manual_control(callback: CallbackQuery, action: Action, home: Home):
+    match action.kind:
+        case "elements":
+            await edit_message(callback.message, "Выберите исполнительный элемент:", reply_markup=CONTROLS.elements_kb)
             return await callback.answer()
-
-        case "el_buzzer":
-            await state.set_state(ManualControl.choosing_buzzer)
-
-            keyboard = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(text="Включить", callback_data="buzz_on")],
-                    [InlineKeyboardButton(text="Выключить", callback_data="buzz_off")],
-                    [InlineKeyboardButton(text="Назад", callback_data="buzz_back")]
-                ]
-            )
-
-            await bot.send_message(callback.message.chat.id, "Управление пищалкой:",  reply_markup=keyboard)
+        case "cancel":
+            await edit_message(callback.message, MANUAL_MODE_TEXT, reply_markup=MANUAL_MENU)
             return await callback.answer()
-
-        case "el_alarm":
-            await state.set_state(ManualControl.choosing_alarm)
-
-            keyboard = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(text="Включить", callback_data="alarm_on")],
-                    [InlineKeyboardButton(text="Выключить", callback_data="alarm_off")],
-                    [InlineKeyboardButton(text="Назад", callback_data="alarm_back")]
-                ]
-            )
-
-            await bot.send_message(callback.message.chat.id, "Управление сигнализацией:",  reply_markup=keyboard)
+        case "choose":
+            await edit_message(callback.message, action.actuator.prompt, reply_markup=CONTROLS.keyboard(action.actuator))
             return await callback.answer()
 
-
-@router.callback_query(ManualControl.choosing_led_color)
-async def led_control(callback: CallbackQuery, state: FSMContext):
-    data = callback.data
-
-    if data == "led_back":
-        await state.set_state(ManualControl.choosing_element)
-        return await cb_set_element(callback, state)
-
-    if data == "led_off":
-        await set_led_color("None")
-        await callback.answer("LED выключен")
+    actuator, option = action.actuator, action.option
+    applied = await apply_command(home, actuator.key, option.value, callback.message.chat.id)
+    if applied:
+        status = option.done
+        text = f"{status}\n\n{MANUAL_MODE_TEXT}" if actuator.announce and status else MANUAL_MODE_TEXT
     else:
-        color = data.replace("led_", "")
-        await set_led_color(color)
-        await callback.answer(f"LED установлен: {color}")
-
-    await state.clear()
-    await bot.send_message(callback.message.chat.id,
-                           "Теперь управление ведется в ручном режиме, вам доступно управление каждым элементом по отдельности. Выберите, что вы хотите сделать.",
-                           reply_markup=await manual_mode_menu())
-    return None
-
-
-@router.callback_query(ManualControl.choosing_window)
-async def window_control(callback: CallbackQuery, state: FSMContext):
-    data = callback.data
-
-    if data == "win_back":
-        await state.set_state(ManualControl.choosing_element)
-        return await cb_set_element(callback, state)
-
-    opened = data == "win_open"
-    await set_window_open(opened)
-
-    await callback.answer()
-    await state.clear()
-    await bot.send_message(callback.message.chat.id,
-                           "Теперь управление ведется в ручном режиме, вам доступно управление каждым элементом по отдельности. Выберите, что вы хотите сделать.",
-                           reply_markup=await manual_mode_menu())
-    return None
-
-
-@router.callback_query(ManualControl.choosing_buzzer)
-async def buzzer_control(callback: CallbackQuery, state: FSMContext):
-    data = callback.data
-
-    if data == "buzz_back":
-        await state.set_state(ManualControl.choosing_element)
-        return await cb_set_element(callback, state)
-
-    enabled = data == "buzz_on"
-    await set_buzzer_active(enabled)
-
-    await callback.answer()
-    await state.clear()
-    await bot.send_message(callback.message.chat.id,
-                           "Теперь управление ведется в ручном режиме, вам доступно управление каждым элементом по отдельности. Выберите, что вы хотите сделать.",
-                           reply_markup=await manual_mode_menu())
-    return None
-
-
-@router.callback_query(ManualControl.choosing_alarm)
-async def alarm_control(callback: CallbackQuery, state: FSMContext):
-    data = callback.data
+        status = command_status(applied)
+        text = f"{status}\n\n{MANUAL_MODE_TEXT}" if actuator.announce else MANUAL_MODE_TEXT
 
-    if data == "alarm_back":
-        await state.set_state(ManualControl.choosing_element)
-        return await cb_set_element(callback, state)
-
-    await set_alarm_active(data == "alarm_on")
-
-    await send_text(
-        f"Сигнализация {'включена' if await get_alarm_active() else 'выключена'}",
-        callback.message.chat.id
-    )
-
-    await callback.answer()
-    await state.clear()
-    await bot.send_message(callback.message.chat.id,
-                           "Теперь управление ведется в ручном режиме, вам доступно управление каждым элементом по отдельности. Выберите, что вы хотите сделать.",
-                           reply_markup=await manual_mode_menu())
+    await callback.answer(status)
+    await edit_message(callback.message, text, reply_markup=MANUAL_MENU)
+    refresh_dashboard(callback.message.chat.id, home)
     return None
 
 
 # ---------- FSM ----------
 @router.message(AlarmStates.waiting_for_code)
-async def process_code(message: Message, state: FSMContext):
+async def process_code(message: Message, state: FSMContext, home: Home):
     code = message.text.strip()
 
     if not code.isdigit() or len(code) != 4:
-        await message.answer("Код должен состоять из 4 цифр. Попробуйте снова.")
+        await send_text("Код должен состоять из 4 цифр. Попробуйте снова.", message.chat.id)
         return
 
-    await set_alarm_code(code)
+    applied = await apply_command(home, "alarm_code", code, message.chat.id)
     await state.clear()
-    await message.answer(f"Новый код сигнализации сохранён: {code}")
+    if applied:
+        await send_text(f"Новый код сигнализации сохранён: {code}", message.chat.id)
+    elif applied is None:
+        await send_text(f"Новый код сигнализации: {code}\n\n{QUEUED_TEXT}", message.chat.id)
+    else:
+        await send_text(f"{REJECTED_TEXT} Код сигнализации не изменён.", message.chat.id)
 
 
 @router.message(AlarmCheckStates.waiting_for_alarm_code)
-async def process_code(message: Message, state: FSMContext):
+async def process_code(message: Message, state: FSMContext, controller: ControllerClient):
     code = message.text.strip()
 
     if not code.isdigit() or len(code) != 4:
-        await message.answer("Код должен состоять из 4 цифр. Попробуйте снова.")
+        await send_text("Код должен состоять из 4 цифр. Попробуйте снова.", message.chat.id)
         return False
 
     await state.clear()
 
-    if code != await get_alarm_code():
+    if code != await controller.get_alarm_code():
         return False
 
     return True
 
 
 @router.message(CheckStates.checking_for_alarm_code)
-async def alarm_code_entered(message: Message, state: FSMContext):
+async def alarm_code_entered(message: Message, state: FSMContext, controller: ControllerClient, home: Home):
     entered = message.text.strip()
+    # Код, сменённый без связи с контроллером, уже действует для бота
+    queued = outbox.get(home.id, "alarm_code")
+    expected = queued.value if queued is not None else await controller.get_alarm_code()
 
-    if entered == await get_alarm_code():
-        await message.answer("Код верный. Ручной режим активирован.")
-
-        await set_control_mode("manual")
+    if entered == expected:
+        applied = await apply_command(home, "control_mode", "manual", message.chat.id)
         await state.clear()
-        await message.answer(
-            "Теперь управление ведется в ручном режиме, вам доступно управление каждым элементом по отдельности."
-            "Выберите, что вы хотите сделать.",
-            reply_markup=await manual_mode_menu()
-        )
+        if applied is False:
+            await send_text(f"{REJECTED_TEXT} Ручной режим не включён.", message.chat.id)
+            return
+        await send_text("Код верный. Ручной режим активирован.", message.chat.id)
+        if applied is None:
+            await send_text(QUEUED_TEXT, message.chat.id)
+        await send_message(message.chat.id, MANUAL_MODE_TEXT, reply_markup=MANUAL_MENU)
     else:
-        await message.answer("❌ Код неверный. Попробуйте снова.")
+        await send_text("❌ Код неверный. Попробуйте снова.", message.chat.id)
 
 
 # ---------- Переход в ручной режим ----------
-async def go_manual(fsm_state: FSMContext):
+async def go_manual(chat_id: int, fsm_state: FSMContext):
     await send_text(
         "Внимание! При переходе в ручной режим все автоматические системы будут остановлены. "
         "Для подтверждения действия отправьте код в чат",
-        default_chat_id
+        chat_id
     )
 
     await fsm_state.set_state(CheckStates.checking_for_alarm_code)
 
 
-async def check_event():
+# ---------- Оповещения о событиях ----------
+EVENT_MESSAGES = {
+    "Gas, open": "Внимание! Превышен уровень газа в воздухе. Окно открыто",
+    "Gas, close": "Уровень газа в норме. Окно закрыто",
+    "Gas, rising": "Внимание! Уровень газа необычно быстро растёт, возможна утечка",
+    "Illegal access": "Внимание! Несанкционированное проникновение в дом",
+    "Moving near": "Обнаружено движение перед домом",
+    "Light_on": "Стемнело. Свет включен",
+    "Light_off": "Посветлело. Свет выключен",
+}
+
+# ---------- Категории оповещений ----------
+ALERT_CATEGORIES = {
+    "gas": "Газ",
+    "intrusion": "Проникновение",
+    "motion": "Движение у дома",
+    "light": "Освещение",
+}
+
+EVENT_CATEGORIES = {
+    "Gas, open": "gas",
+    "Gas, close": "gas",
+    "Gas, rising": "gas",
+    "Illegal access": "intrusion",
+    "Moving near": "motion",
+    "Light_on": "light",
+    "Light_off": "light",
+}
+
+
+def render_events(events: list[ControllerEvent]) -> str | None:
+    texts = [EVENT_MESSAGES[e.value] for e in events if e.value in EVENT_MESSAGES]
+    if not texts:
+        return None
+    if len(texts) == 1:
+        return texts[0]
+    return "Несколько событий подряд:\n" + "\n".join(f"• {text}" for text in texts)
+
+
+@router.message(F.text.startswith("/events"))
+async def cmd_events(message: Message, home: Home):
+    # /events [30m|6h|1d]
+    args = message.text.split()[1:]
+    window = parse_window(args[0]) if args else 86400
+    if window is None or len(args) > 1:
+        await send_text("Использование: /events [30m|6h|1d]", message.chat.id)
+        return
+
+    records = await asyncio.to_thread(
+        journal.query, time.time() - window, home_id=home.id, limit=journal_limit
+    )
+    if not records:
+        await send_text(f"📜 За {window / 3600:g} ч событий не было", message.chat.id)
+        return
+    lines = [f"📜 События за {window / 3600:g} ч (последние {journal_limit}):\n"]
+    for record in records:
+        when = time.strftime("%d.%m %H:%M:%S", time.localtime(record.ts))
+        lines.append(f"{when} - {EVENT_MESSAGES.get(record.value, record.value)}")
+    await send_text("\n".join(lines), message.chat.id)
+
+
+# Каждый чат получает только события своих категорий; одинаковые наборы
+# событий рендерятся один раз, а доставку параллельно ведёт очередь исходящих
+async def send_events(home: Home, events: list[ControllerEvent]):
+    per_chat: dict[int, list[ControllerEvent]] = {}
+    for event in events:
+        journal.append(event.ts, home.id, event.value, event.seq)
+        category = EVENT_CATEGORIES.get(event.value)
+        if category is None:
+            continue
+        for chat_id in subscribers.recipients(home.id, category):
+            per_chat.setdefault(chat_id, []).append(event)
+
+    texts: dict[tuple[str, ...], str | None] = {}
+    for chat_id, chat_events in per_chat.items():
+        key = tuple(e.value for e in chat_events)
+        if key not in texts:
+            texts[key] = render_events(chat_events)
+        if texts[key] is not None:
+            await send_text(texts[key], chat_id, priority=Priority.ALERT)
+
+
+async def check_event(home: Home):
+    dedup = EventDeduplicator(
+        partial(send_events, home),
+        repeat_window=event_repeat_window,
+        burst_window=event_burst_window,
+    )
+    # Без push события опрашивает общий планировщик и складывает в очередь потока
+    stream = EventStream(home.controller, polled=asyncio.Queue())
+    event_streams[home.id] = stream
     try:
-        logger.info("Информатор запущен")
-        while True:
-            if get_control_mode() == "auto":
-                match get_event():
-                    case "None":
-                        pass
-                    case "Gas, open":
-                        await send_text("Внимание! Превышен уровень газа в воздухе. Окно открыто")
-                    case "Gas, close":
-                        await send_text("Уровень газа в норме. Окно закрыто")
-                    case "Illegal access":
-                        await send_text("Внимание! Несанкционированное проникновение в домЙ")
-                    case "Moving near":
-                        await send_text("Обнаружено движение перед домом")
-                    case "Light_on":
-                        await send_text("Стемнело. Свет включен")
-                    case "Light_off":
-                        await send_text("Посветлело. Свет выключен")
-
-            await asyncio.sleep(1)
+        logger.info(f"Информатор запущен: {home.id}")
+        async for event in stream:
+            # Режим берём из памяти клиента: его обновляют опросы и наши же команды
+            if home.controller.last_known("control_mode") != "manual":
+                await dedup.feed(event)
 
     except asyncio.CancelledError:
-        logger.info("Информатор остановлен")
+        await dedup.close()
+        logger.info(f"Информатор остановлен: {home.id}")
+        raise
+
+
+# ---------- Обработка результатов опроса ----------
+def should_poll(home: Home, key: str) -> bool:
+    if key == "event":
+        # События опрашиваются, пока поток SSE не подключён (push недоступен или
+        # переподключается) и дом не в ручном режиме
+        stream = event_streams.get(home.id)
+        return stream is not None and not stream.connected and home.controller.last_known("control_mode") != "manual"
+    return True
+
+
+async def on_polled(home: Home, key: str, value):
+    if home.controller.is_stale(key):
+        # Контроллер недоступен, это последнее известное значение, а не новое показание:
+        # в историю и детектор газа оно не идёт и не означает, что связь вернулась
+        return
+
+    if value is not None and outbox.has(home.id):
+        # Контроллер снова отвечает - не ждём очередной попытки доставить отложенное
+        outbox.wake()
+
+    if key == "event":
+        if value is not None:
+            event_streams[home.id].polled.put_nowait(value)
+        return
+
+    if key == "pir_motion" and value:
+        scheduler.boost(home)
+        return
+
+    if key in HISTORY_SENSORS and isinstance(value, (int, float)) and not isinstance(value, bool):
+        ts = time.time()
+        home.history.append(ts, {key: value})
+        # Предупреждаем раньше, чем сработает порог газа на самом контроллере
+        if key == "last_mq2" and home.gas.update(ts, value) is not None:
+            await send_events(home, [ControllerEvent("Gas, rising", ts=ts)])
 
 
 # ---------- Логирование ----------
@@ -688,22 +902,140 @@ bot = Bot(
     token=bot_token,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
-dp = Dispatcher()
+# Хранилище закрывается (и досбрасывает изменения) при остановке диспетчера.
+# Если процессов несколько, кэш в памяти отключён: состояние общее только в базе
+dp = Dispatcher(storage=SQLiteStorage(
+    fsm_db,
+    flush_interval=fsm_flush_interval if worker_count == 1 else 0,
+    cache_size=fsm_cache_size if worker_count == 1 else 0,
+))
 logger.info("Bot and dispatcher initialized. State object created.")
 
 
 # ---------- Запуск ----------
 dp.include_router(router)
+async def on_startup(run_watchers: bool = True, worker: int = 0):
+    global outbound, scheduler, metrics_runner
+    started = time.perf_counter()
+    home_options = dict(
+        history_capacity=history_capacity,
+        history_interval=history_interval,
+        shadow_min_interval=shadow_min_interval,
+        shadow_max_interval=shadow_max_interval,
+        gas_options=gas_detector,
+        limit=controller_pool_limit,
+        keepalive_timeout=controller_keepalive,
+        request_timeout=controller_timeout,
+        cache_ttls=controller_cache_ttls,
+        cache_size=controller_cache_size,
+        retries=controller_retries,
+        breaker_threshold=breaker_threshold,
+        breaker_reset=breaker_reset,
+        write_window=controller_write_window,
+    )
+    homes.add(Home(default_home_id, SERVER_URL, **home_options))
+    homes.load(homes_file, **home_options)
+    await asyncio.gather(homes.start(), subscribers.open(), outbox.open())
+    if run_watchers:
+        journal.open()
+    outbound = OutboundQueue(
+        bot,
+        # Лимит Telegram общий на бота, поэтому делится между процессами
+        global_rate=outbound_global_rate / worker_count,
+        chat_rate=outbound_chat_rate,
+        workers=outbound_workers,
+        merge=outbound_merge,
+    )
+    outbound.start()
+    await dashboards.open(outbound)
+    if run_watchers:
+        scheduler = PollScheduler(
+            poll_plan,
+            on_value=on_polled,
+            should_poll=should_poll,
+            limiter=poll_slots,
+            boost_duration=poll_boost_duration,
+        )
+        for home in homes:
+            scheduler.add_home(home)
+        supervisor.add("scheduler", scheduler.run)
+        for home in homes:
+            supervisor.add(f"events:{home.id}", partial(check_event, home))
+            supervisor.add(f"shadow:{home.id}", home.shadow.run)
+        supervisor.add("dashboards", watch_dashboards)
+        supervisor.add("outbox", partial(outbox.run, outbox_writer, notify_replayed))
+    # Воркеры работают сами по себе, опрос Telegram стартует сразу за ними
+    supervisor.start()
+    if metrics_enabled and metrics_port:
+        metrics_runner = await serve_metrics(metrics_host, metrics_port + worker)
+    logger.info(f"[BOT] Запуск занял {(time.perf_counter() - started) * 1000:.0f} мс")
+
+
+async def on_shutdown():
+    # Сначала гасим источники оповещений, потом досылаем то, что уже в очереди
+    await supervisor.stop()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    await dashboards.close()
+    await outbound.close()
+    await subscribers.close()
+    await outbox.close()
+    journal.close()
+    await homes.close()
+    await bot.session.close()
+
+
 async def main():
-    global task
     logger.info("Бот запускается...")
+    await on_startup()
     try:
         await dp.start_polling(bot)
-        task = asyncio.create_task(check_event())
     finally:
-        await bot.session.close()
+        await on_shutdown()
         logger.info("Бот завершил работу.")
 
 
+# ---------- Запуск в режиме вебхука ----------
+# Фоновые задачи (информаторы, опрос, сверка) и регистрацию вебхука ведёт только
+# процесс 0, остальные лишь обрабатывают обновления.
+async def run_webhook(worker: int):
+    primary = worker == 0
+    if not webhook_secret:
+        raise RuntimeError("Режим вебхука без webhook_secret небезопасен: задайте WEBHOOK_SECRET")
+    logger.info(f"Бот запускается (вебхук, процесс {worker})...")
+    await on_startup(run_watchers=primary, worker=worker)
+    if primary:
+        await bot.set_webhook(
+            f"{webhook_base_url}{webhook_path}",
+            secret_token=webhook_secret or None,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    app = build_app(dp, bot, path=webhook_path, secret=webhook_secret)
+    runner = await serve(app, webapp_host, webapp_port, reuse_port=worker_count > 1)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        await on_shutdown()
+        logger.info(f"Бот завершил работу (процесс {worker}).")
+
+
+def webhook_worker(worker: int):
+    asyncio.run(run_webhook(worker))
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if run_mode == "webhook":
+        if not webhook_secret:
+            # Через окружение секрет получат и процессы, запущенные без fork
+            webhook_secret = os.environ["WEBHOOK_SECRET"] = secrets.token_urlsafe(32)
+            logger.info("[WEBHOOK] webhook_secret не задан, сгенерирован случайный")
+        run_workers(webhook_workers, webhook_worker)
+    else:
+        asyncio.run(main())
@@ -0,0 +1,207 @@
+import contextlib
+import logging
+import time
+from bisect import bisect_left
+from collections.abc import Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+Labels = tuple[str, ...]
+
+
+# ---------- Инструменты ----------
+# Пока реестр выключен, observe/inc сразу возвращаются, а time() отдаёт
+# готовый пустой контекст - на горячем пути остаётся одна проверка флага.
+class Counter:
+    kind = "counter"
+
+    def __init__(self, registry: "Registry", name: str, help: str, labelnames: Labels = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        if not self.registry.enabled:
+            return
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, labels, value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, registry: "Registry", name: str, help: str, labelnames: Labels = (), buckets=DEFAULT_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # По каждому набору меток: счётчики корзин (последняя - +Inf), сумма, количество
+        self.values: dict[Labels, list] = {}
+
+    def observe(self, labels: Labels, value: float):
+        if not self.registry.enabled:
+            return
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def time(self, labels: Labels = ()):
+        if not self.registry.enabled:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def quantile(self, labels: Labels, q: float) -> float | None:
+        # Оценка по корзинам с линейной интерполяцией внутри корзины
+        entry = self.values.get(labels)
+        if entry is None or not entry[2]:
+            return None
+        rank = q * entry[2]
+        seen, lower = 0, 0.0
+        for upper, count in zip(self.buckets + (self.buckets[-1],), entry[0]):
+            if seen + count >= rank and count:
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return self.buckets[-1]
+
+    def samples(self):
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for upper, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = "+Inf" if upper == float("inf") else f"{upper:g}"
+                yield f"{self.name}_bucket", labels + (le,), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: Labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(self.labels, time.perf_counter() - self.started)
+
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class Collector:
+    # Значение снимается в момент выдачи метрик: глубина очереди, задержка цикла и т.п.
+    # read возвращает число или словарь {значение метки: число}
+    def __init__(self, name: str, help: str, kind: str, read: Callable[[], float | dict], labelnames: Labels = ()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = labelnames
+        self.read = read
+
+    def samples(self):
+        value = self.read()
+        if isinstance(value, dict):
+            for label, item in value.items():
+                yield self.name, (str(label),), item
+        else:
+            yield self.name, (), value
+
+
+# ---------- Реестр ----------
+class Registry:
+    def __init__(self):
+        self.enabled = False
+        self._metrics: dict[str, Counter | Histogram | Collector] = {}
+
+    def counter(self, name: str, help: str, labelnames: Labels = ()) -> Counter:
+        return self._register(Counter(self, name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Labels = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help, labelnames, buckets))
+
+    def collector(
+        self,
+        name: str,
+        help: str,
+        read: Callable[[], float | dict],
+        kind: str = "gauge",
+        labelnames: Labels = (),
+    ) -> Collector:
+        return self._register(Collector(name, help, kind, read, labelnames))
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        # Текстовый формат Prometheus (version 0.0.4)
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            names = metric.labelnames + (("le",) if metric.kind == "histogram" else ())
+            for sample, labels, value in metric.samples():
+                if labels:
+                    pairs = ",".join(f'{name}="{label}"' for name, label in zip(names, labels))
+                    sample = f"{sample}{{{pairs}}}"
+                lines.append(f"{sample} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = REGISTRY.histogram("bot_handler_seconds", "Время работы хендлеров", ("handler",))
+
+
+# ---------- Замер хендлеров ----------
+class HandlerTimingMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict], Awaitable],
+        event: TelegramObject,
+        data: dict,
+    ):
+        if not REGISTRY.enabled:
+            return await handler(event, data)
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else type(event).__name__
+        with HANDLER_LATENCY.time((name,)):
+            return await handler(event, data)
+
+
+# ---------- HTTP-эндпоинт для Prometheus ----------
+async def serve_metrics(host: str, port: int, registry: Registry = REGISTRY) -> web.AppRunner:
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"[METRICS] Метрики на http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,101 @@
+import logging
+from dataclasses import dataclass, fields
+
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- Разбор значений контроллера ----------
+# Контроллер отдаёт что придётся: 1 вместо true, "23" вместо 23. Каждый ключ
+# приводится к своему типу; что привести нельзя, отбрасывается (None), чтобы
+# мусор не попал в кэш, историю и тексты.
+_BOOL_STRINGS = {"true": True, "false": False, "1": True, "0": False, "on": True, "off": False}
+
+
+def _bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.lower() in _BOOL_STRINGS:
+        return _BOOL_STRINGS[value.lower()]
+    raise ValueError(value)
+
+
+def _number(value) -> int | float:
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, (int, float)):
+        return value
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def _text(value) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ValueError(value)
+
+
+SENSOR_TYPES = {
+    "inside_presence": _bool,
+    "pir_motion": _bool,
+    "last_ldr": _number,
+    "last_mq2": _number,
+    "last_temp": _number,
+    "last_hum": _number,
+}
+ACTUATOR_TYPES = {
+    "led_color": _text,
+    "window_open": _bool,
+    "buzzer_active": _bool,
+    "alarm_active": _bool,
+}
+SETTING_TYPES = {
+    "control_mode": _text,
+    "alarm_code": _text,
+    "event": _text,
+}
+SCHEMA = {**SENSOR_TYPES, **ACTUATOR_TYPES, **SETTING_TYPES}
+
+
+def decode_value(key: str, value):
+    if value is None:
+        return None
+    convert = SCHEMA.get(key)
+    if convert is None:
+        return value
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        logger.warning(f"[CTL] Некорректное значение {key}: {value!r}")
+        return None
+
+
+# ---------- Снимок состояния системы ----------
+# Со __slots__ - меньше памяти на экземпляр. Снимок после создания не меняют
+# (только dataclasses.replace), поэтому хэш по значениям безопасен и тексты
+# кэшируются по самому снимку; frozen=True сделал бы создание в разы медленнее.
+@dataclass(slots=True, unsafe_hash=True)
+class StateSnapshot:
+    inside_presence: bool | None = None
+    pir_motion: bool | None = None
+    last_ldr: int | float | None = None
+    last_mq2: int | float | None = None
+    last_temp: int | float | None = None
+    last_hum: int | float | None = None
+    led_color: str | None = None
+    window_open: bool | None = None
+    buzzer_active: bool | None = None
+    alarm_active: bool | None = None
+    # Контроллер недоступен, часть значений - последние известные
+    stale: bool = False
+
+    @classmethod
+    def keys(cls) -> tuple[str, ...]:
+        return STATE_KEYS
+
+
+STATE_KEYS = tuple(f.name for f in fields(StateSnapshot) if f.name != "stale")
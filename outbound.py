@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest, TelegramRetryAfter
+
+
+logger = logging.getLogger(__name__)
+
+# Telegram не принимает сообщения длиннее 4096 символов
+MAX_MESSAGE_LENGTH = 4096
+
+
+class Priority(IntEnum):
+    ALERT = 0
+    NORMAL = 1
+
+
+# ---------- Корзина токенов ----------
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self, now: float) -> float:
+        # Сколько ждать до следующего токена; 0 - можно отправлять сейчас
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def idle(self, now: float) -> bool:
+        return now >= self.paused_until and self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+@dataclass
+class OutboundMessage:
+    chat_id: int
+    text: str
+    priority: Priority
+    kwargs: dict
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+    # Не None - это правка уже отправленного сообщения, а не новое
+    message_id: int | None = None
+    # False - сообщение ни с чем не склеивается (например, панель состояния)
+    merge: bool = True
+
+
+# ---------- Очередь исходящих сообщений ----------
+# Все сообщения бота проходят через одну очередь с общей и поканальной корзинами
+# токенов. Тревоги идут отдельной полосой и обгоняют обычные ответы меню.
+# Для одного чата порядок сохраняется: пока его сообщение в пути, следующее ждёт.
+# Правки сообщений идут по тем же лимитам; несколько правок одного сообщения,
+# ещё ждущих в очереди, схлопываются в последнюю.
+class OutboundQueue:
+    def __init__(
+        self,
+        bot: Bot,
+        *,
+        global_rate: float = 25,
+        global_burst: float = 30,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        workers: int = 8,
+        merge: bool = True,
+        max_attempts: int = 5,
+    ):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.merge = merge
+        self.max_attempts = max_attempts
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats: dict[int, TokenBucket] = {}
+        self._lanes: dict[Priority, OrderedDict[int, deque[OutboundMessage]]] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self._busy: set[int] = set()
+        self._slots = asyncio.Semaphore(workers)
+        self._wakeup = asyncio.Event()
+        self._runner: asyncio.Task | None = None
+        self._inflight: set[asyncio.Task] = set()
+
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.merged = 0
+        self.edited = 0
+        self.coalesced = 0
+        self._latencies: deque[float] = deque(maxlen=1000)
+
+    # ---------- Постановка в очередь ----------
+    def send(
+        self, chat_id: int, text: str, *, priority: Priority = Priority.NORMAL, merge: bool = True, **kwargs
+    ) -> asyncio.Future:
+        lane = self._lanes[priority]
+        queue = lane.get(chat_id)
+        if queue is None:
+            queue = lane[chat_id] = deque()
+
+        # Простые тексты подряд в один чат склеиваются в одно сообщение
+        if self.merge and merge and not kwargs and queue:
+            last = queue[-1]
+            if (
+                last.merge
+                and not last.kwargs
+                and last.message_id is None
+                and len(last.text) + len(text) + 2 <= MAX_MESSAGE_LENGTH
+            ):
+                last.text = f"{last.text}\n\n{text}"
+                self.merged += 1
+                return last.future
+
+        message = OutboundMessage(
+            chat_id, text, priority, kwargs, asyncio.get_running_loop().create_future(), merge=merge
+        )
+        queue.append(message)
+        self._wakeup.set()
+        return message.future
+
+    def edit(self, chat_id: int, message_id: int, text: str, **kwargs) -> asyncio.Future:
+        lane = self._lanes[Priority.NORMAL]
+        queue = lane.get(chat_id)
+        if queue is None:
+            queue = lane[chat_id] = deque()
+
+        for queued in queue:
+            if queued.message_id == message_id:
+                queued.text = text
+                queued.kwargs = kwargs
+                self.coalesced += 1
+                return queued.future
+
+        message = OutboundMessage(
+            chat_id, text, Priority.NORMAL, kwargs, asyncio.get_running_loop().create_future(), message_id=message_id
+        )
+        queue.append(message)
+        self._wakeup.set()
+        return message.future
+
+    def depth(self) -> dict[str, int]:
+        return {
+            priority.name.lower(): sum(len(queue) for queue in lane.values())
+            for priority, lane in self._lanes.items()
+        }
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            "depth": self.depth(),
+            "in_flight": len(self._busy),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "merged": self.merged,
+            "edited": self.edited,
+            "coalesced": self.coalesced,
+            "latency_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+            "latency_p99": latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+        }
+
+    # ---------- Запуск и остановка ----------
+    def start(self):
+        if self._runner is None:
+            self._runner = asyncio.create_task(self._run())
+
+    async def close(self, drain_timeout: float = 5):
+        # Даём очереди дослать накопленное, затем останавливаем планировщик
+        deadline = time.monotonic() + drain_timeout
+        while (any(self.depth().values()) or self._inflight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        for task in list(self._inflight):
+            task.cancel()
+        await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    # ---------- Планировщик ----------
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _next(self) -> tuple[OutboundMessage | None, float | None]:
+        now = time.monotonic()
+        wait = self._global.delay(now)
+        if wait > 0:
+            return None, wait
+
+        wait = None
+        for lane in self._lanes.values():
+            for chat_id, queue in lane.items():
+                if chat_id in self._busy:
+                    continue
+                delay = self._chat_bucket(chat_id).delay(now)
+                if delay > 0:
+                    wait = delay if wait is None else min(wait, delay)
+                    continue
+
+                message = queue.popleft()
+                if queue:
+                    # Чат уходит в конец, чтобы остальные получили свою очередь
+                    lane.move_to_end(chat_id)
+                else:
+                    del lane[chat_id]
+                self._global.take()
+                self._chats[chat_id].take()
+                return message, None
+        return None, wait
+
+    async def _run(self):
+        while True:
+            message, wait = self._next()
+            if message is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._slots.acquire()
+            self._busy.add(message.chat_id)
+            task = asyncio.create_task(self._deliver(message))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _deliver(self, message: OutboundMessage):
+        try:
+            message.attempts += 1
+            if message.message_id is None:
+                result = await self.bot.send_message(chat_id=message.chat_id, text=message.text, **message.kwargs)
+            else:
+                result = await self.bot.edit_message_text(
+                    text=message.text, chat_id=message.chat_id, message_id=message.message_id, **message.kwargs
+                )
+        except TelegramRetryAfter as e:
+            logger.warning(f"[BOT] Flood control для чата {message.chat_id}, повтор через {e.retry_after} с")
+            self._chat_bucket(message.chat_id).pause(e.retry_after)
+            # Ограничение может быть и на весь бот - пока оно действует, не отправляем никому
+            self._global.pause(e.retry_after)
+            self._retry(message, e)
+        except TelegramBadRequest as e:
+            if message.message_id is not None and "message is not modified" in e.message:
+                # Текст уже такой - правка не нужна, это не ошибка
+                self._done(message, True)
+            else:
+                self._fail(message, e)
+        except TelegramForbiddenError as e:
+            self._fail(message, e)
+        except Exception as e:
+            self._chat_bucket(message.chat_id).pause(min(2 ** message.attempts, 30))
+            self._retry(message, e)
+        else:
+            self._done(message, result)
+        finally:
+            self._busy.discard(message.chat_id)
+            self._slots.release()
+            self._prune_buckets()
+            self._wakeup.set()
+
+    def _done(self, message: OutboundMessage, result):
+        self._latencies.append(time.monotonic() - message.enqueued_at)
+        if not message.future.done():
+            message.future.set_result(result)
+        if message.message_id is None:
+            self.sent += 1
+            logger.info(f"[BOT] Sent: {message.text}")
+        else:
+            self.edited += 1
+            logger.info(f"[BOT] Edited {message.message_id}: {message.text}")
+
+    def _retry(self, message: OutboundMessage, error: Exception):
+        if message.attempts >= self.max_attempts:
+            self._fail(message, error)
+            return
+        self.retried += 1
+        lane = self._lanes[message.priority]
+        queue = lane.get(message.chat_id)
+        if queue is None:
+            queue = lane[message.chat_id] = deque()
+        queue.appendleft(message)
+
+    def _fail(self, message: OutboundMessage, error: Exception):
+        self.failed += 1
+        logger.error(f"[BOT] Error sending message: {error}")
+        if not message.future.done():
+            message.future.set_exception(error)
+            # Отправитель мог не ждать результата - не даём asyncio ругаться на это
+            message.future.exception()
+
+    def _prune_buckets(self):
+        # Корзины чатов, которые давно молчат, полны - их можно забыть
+        if len(self._chats) > 1024:
+            now = time.monotonic()
+            for chat_id in [c for c, b in self._chats.items() if c not in self._busy and b.idle(now)]:
+                if not any(chat_id in lane for lane in self._lanes.values()):
+                    del self._chats[chat_id]
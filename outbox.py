@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+import codec
+
+
+logger = logging.getLogger(__name__)
+
+# Запись пакета команд: ключ -> True (принята), False (отклонена); ключей, до
+# которых не дошло из-за недоступности контроллера, в ответе нет (или там None)
+Writer = Callable[[dict[str, object]], Awaitable[dict[str, bool | None]]]
+
+# Ключи, команды которым не должны теряться при недоступном контроллере
+DURABLE_KEYS = frozenset({"led_color", "window_open", "buzzer_active", "alarm_active", "control_mode", "alarm_code"})
+
+
+@dataclass
+class OutboxEntry:
+    home_id: str
+    key: str
+    value: object
+    seq: int
+    chat_id: int | None
+    created_at: float
+
+
+# ---------- Отложенные команды контроллерам ----------
+# Команда, которую контроллер не принял, ложится в SQLite, а не теряется. На
+# каждый (дом, ключ) хранится одна запись: новая команда тому же элементу
+# заменяет старую, но получает новый номер, так что порядок команд сохраняется.
+# Воркер пробует доставить очередь каждые retry_interval секунд или сразу после
+# wake() (контроллер снова ответил) - все команды дома одним пакетом, дома
+# параллельно (не больше slots одновременно). Команда, которую контроллер
+# отклонил (а не просто не ответил), удаляется: повтор её не исправит. Пока у
+# дома есть очередь, новые команды встают в её конец, чтобы не обогнать старые.
+class Outbox:
+    def __init__(
+        self,
+        path: str,
+        *,
+        retry_interval: float = 5,
+        slots: int = 32,
+        shared: bool = False,
+    ):
+        self.path = path
+        self.retry_interval = retry_interval
+        self.shared = shared
+        self.replayed = 0
+        self.rejected = 0
+        self.replays = 0
+        self._slots = asyncio.Semaphore(slots)
+        self._db: sqlite3.Connection | None = None
+        self._data_version: int | None = None
+        self._lock = asyncio.Lock()
+        self._pending: dict[str, dict[str, OutboxEntry]] = {}
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+
+    async def open(self):
+        self._db = await asyncio.to_thread(self._connect)
+        await asyncio.to_thread(self._reload)
+        if len(self):
+            logger.info(f"[OUTBOX] Отложенных команд: {len(self)}")
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " home_id TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " chat_id INTEGER,"
+            " created_at REAL NOT NULL,"
+            " PRIMARY KEY (home_id, key))"
+        )
+        db.commit()
+        return db
+
+    def _reload(self):
+        self._data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        rows = self._db.execute("SELECT home_id, key, value, seq, chat_id, created_at FROM outbox").fetchall()
+        self._pending.clear()
+        for home_id, key, value, seq, chat_id, created_at in rows:
+            entry = OutboxEntry(home_id, key, codec.loads(value), seq, chat_id, created_at)
+            self._pending.setdefault(home_id, {})[key] = entry
+            self._seq = max(self._seq, seq)
+
+    def _refresh(self):
+        if not self.shared or self._db is None:
+            return
+        if self._db.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+            self._reload()
+
+    async def close(self):
+        if self._db is not None:
+            await asyncio.to_thread(self._db.close)
+            self._db = None
+
+    # ---------- Чтение ----------
+    def __len__(self) -> int:
+        self._refresh()
+        return sum(len(entries) for entries in self._pending.values())
+
+    def has(self, home_id: str) -> bool:
+        self._refresh()
+        return bool(self._pending.get(home_id))
+
+    def get(self, home_id: str, key: str) -> OutboxEntry | None:
+        self._refresh()
+        return self._pending.get(home_id, {}).get(key)
+
+    def pending(self, home_id: str) -> list[OutboxEntry]:
+        self._refresh()
+        return sorted(self._pending.get(home_id, {}).values(), key=lambda entry: entry.seq)
+
+    # ---------- Постановка в очередь ----------
+    async def put(self, home_id: str, key: str, value, chat_id: int | None = None):
+        self._refresh()
+        if self.shared:
+            # Номер должен быть больше, чем у записей других процессов
+            self._seq = max(self._seq, await asyncio.to_thread(self._max_seq))
+        self._seq += 1
+        entry = OutboxEntry(home_id, key, value, self._seq, chat_id, time.time())
+        self._pending.setdefault(home_id, {})[key] = entry
+        await self._write(
+            "INSERT INTO outbox (home_id, key, value, seq, chat_id, created_at) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(home_id, key) DO UPDATE SET value = excluded.value, seq = excluded.seq, "
+            "chat_id = excluded.chat_id, created_at = excluded.created_at",
+            [(home_id, key, codec.dumps(value), entry.seq, chat_id, entry.created_at)],
+        )
+        # Код сигнализации в лог не пишем
+        shown = "***" if key == "alarm_code" else repr(value)
+        logger.info(f"[OUTBOX] {home_id}/{key} = {shown} отложено до восстановления связи")
+
+    def _max_seq(self) -> int:
+        return self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM outbox").fetchone()[0]
+
+    def wake(self):
+        self._wakeup.set()
+
+    # ---------- Доставка ----------
+    async def replay(self, home_id: str, write: Writer) -> tuple[list[OutboxEntry], list[OutboxEntry]]:
+        # Возвращает выполненные и отклонённые контроллером команды
+        entries = self.pending(home_id)
+        if not entries:
+            return [], []
+        async with self._slots:
+            results = await write({entry.key: entry.value for entry in entries})
+        self.replays += 1
+
+        # За время доставки элементу могли дать новую команду - её не трогаем
+        done, rejected = [], []
+        current = self._pending.get(home_id, {})
+        for entry in entries:
+            ok = results.get(entry.key)
+            latest = current.get(entry.key)
+            if ok is None or latest is None or latest.seq != entry.seq:
+                continue
+            del current[entry.key]
+            (done if ok else rejected).append(entry)
+        if not current:
+            self._pending.pop(home_id, None)
+        if not done and not rejected:
+            return [], []
+
+        await self._write(
+            "DELETE FROM outbox WHERE home_id = ? AND key = ? AND seq = ?",
+            [(entry.home_id, entry.key, entry.seq) for entry in done + rejected],
+        )
+        self.replayed += len(done)
+        self.rejected += len(rejected)
+        if done:
+            logger.info(f"[OUTBOX] {home_id}: доставлено отложенных команд {len(done)} из {len(entries)}")
+        if rejected:
+            logger.warning(f"[OUTBOX] {home_id}: контроллер отклонил {', '.join(entry.key for entry in rejected)}")
+        return done, rejected
+
+    async def run(
+        self,
+        write_for: Callable[[str], Writer | None],
+        on_replayed: Callable[[str, list[OutboxEntry], list[OutboxEntry]], Awaitable] | None = None,
+    ):
+        while True:
+            self._wakeup.clear()
+            self._refresh()
+            writers = {home_id: write_for(home_id) for home_id, entries in self._pending.items() if entries}
+            writers = {home_id: write for home_id, write in writers.items() if write is not None}
+            if writers:
+                results = await asyncio.gather(
+                    *(self.replay(home_id, write) for home_id, write in writers.items()), return_exceptions=True
+                )
+                for home_id, result in zip(writers, results):
+                    if isinstance(result, Exception):
+                        logger.warning(f"[OUTBOX] {home_id}: доставка не удалась: {result!r}")
+                    elif any(result) and on_replayed is not None:
+                        try:
+                            await on_replayed(home_id, *result)
+                        except Exception as e:
+                            logger.error(f"[OUTBOX] Ошибка обработки доставленных команд {home_id}: {e!r}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.retry_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _write(self, sql: str, rows: list[tuple]):
+        async with self._lock:
+            await asyncio.to_thread(self._execute, sql, rows)
+
+    def _execute(self, sql: str, rows: list[tuple]):
+        with self._db:
+            self._db.executemany(sql, rows)
@@ -0,0 +1,60 @@
+import random
+import time
+
+
+class ControllerUnavailable(Exception):
+    pass
+
+
+class ServerError(Exception):
+    pass
+
+
+# ---------- Предохранитель (circuit breaker) ----------
+# closed    - запросы идут как обычно, ошибки подряд копятся;
+# open      - после threshold ошибок подряд запросы не делаются reset_timeout секунд;
+# half_open - по истечении паузы пропускается один пробный запрос.
+class CircuitBreaker:
+    def __init__(self, *, threshold: int = 3, reset_timeout: float = 15):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._probe = False
+        if self.state == "half_open" and not self._probe:
+            self._probe = True
+            return True
+        return False
+
+    def release(self):
+        # Пробный запрос отменён, не дождавшись ответа, - следующий может пробовать снова
+        if self.state == "half_open":
+            self._probe = False
+
+    def success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probe = False
+
+    def failure(self) -> bool:
+        # True - предохранитель только что разомкнулся
+        self.failures += 1
+        if self.state != "open" and (self.state == "half_open" or self.failures >= self.threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._probe = False
+            return True
+        return False
+
+
+def backoff(attempt: int, base: float = 0.1, cap: float = 2) -> float:
+    # Экспоненциальная пауза с разбросом, чтобы повторы разных запросов не совпадали
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.5)
@@ -0,0 +1,165 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import random
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from metrics import REGISTRY
+
+
+logger = logging.getLogger(__name__)
+
+POLL_DURATION = REGISTRY.histogram("poll_seconds", "Длительность одного опроса по ключам", ("key",))
+
+
+@dataclass(frozen=True)
+class PollSpec:
+    # Обычный период опроса, предел замедления и приоритет (0 - самый важный).
+    # idle_backoff=False - не замедлять опрос, пока значение не меняется (события:
+    # первая тревога после затишья не должна ждать); при сбоях замедляется всё равно
+    interval: float
+    max_interval: float
+    priority: int = 1
+    idle_backoff: bool = True
+
+
+class PollJob:
+    __slots__ = ("home", "key", "spec", "interval", "last_value")
+
+    def __init__(self, home, key: str, spec: PollSpec):
+        self.home = home
+        self.key = key
+        self.spec = spec
+        self.interval = spec.interval
+        self.last_value = None
+
+
+# ---------- Планировщик опроса контроллеров ----------
+# Все опросы всех домов стоят в одной куче по времени следующего запуска, её
+# разбирает одна задача. Срок наступил - опрос уходит отдельной задачей через
+# общий ограничитель, и первыми стартуют более приоритетные ключи. Значение не
+# меняется, контроллер отвечает медленно или недоступен - период растёт в
+# backoff раз до max_interval; значение изменилось - возвращается к обычному.
+# На время boost (например, движение у дома) все ключи дома опрашиваются чаще.
+class PollScheduler:
+    def __init__(
+        self,
+        plan: dict[str, PollSpec],
+        *,
+        on_value: Callable[[object, str, object], Awaitable],
+        should_poll: Callable[[object, str], bool] | None = None,
+        limiter: asyncio.Semaphore | None = None,
+        backoff: float = 1.5,
+        slow_threshold: float = 1,
+        boost_factor: float = 0.5,
+        boost_duration: float = 60,
+    ):
+        self.plan = plan
+        self.on_value = on_value
+        self.should_poll = should_poll or (lambda home, key: True)
+        self.limiter = limiter or contextlib.nullcontext()
+        self.backoff = backoff
+        self.slow_threshold = slow_threshold
+        self.boost_factor = boost_factor
+        self.boost_duration = boost_duration
+        self.polls = 0
+        self.skipped = 0
+        self._heap: list[tuple[float, int, int, PollJob]] = []
+        self._order = itertools.count()
+        self._boost_until: dict[str, float] = {}
+        self._running: set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+
+    def add_home(self, home):
+        now = time.monotonic()
+        for key, spec in self.plan.items():
+            # Дома стартуют вразнобой, чтобы их опросы не шли в ногу
+            self._push(PollJob(home, key, spec), now + random.uniform(0, spec.interval))
+
+    def boost(self, home, duration: float | None = None):
+        self._boost_until[home.id] = time.monotonic() + (duration or self.boost_duration)
+
+    def _push(self, job: PollJob, due: float):
+        heapq.heappush(self._heap, (due, job.spec.priority, next(self._order), job))
+        self._wakeup.set()
+
+    # ---------- Основной цикл ----------
+    async def run(self):
+        try:
+            while True:
+                self._wakeup.clear()
+                now = time.monotonic()
+                if not self._heap or self._heap[0][0] > now:
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    continue
+
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap))
+                for _, _, _, job in sorted(due, key=lambda entry: entry[1]):
+                    try:
+                        poll = self.should_poll(job.home, job.key)
+                    except Exception as e:
+                        logger.error(f"[POLL] Ошибка проверки {job.home.id}/{job.key}: {e!r}")
+                        poll = False
+                    if not poll:
+                        # Опрос не нужен (например, ручной режим) - просто переносим
+                        self.skipped += 1
+                        self._push(job, now + job.spec.interval)
+                        continue
+                    task = asyncio.create_task(self._poll(job))
+                    self._running.add(task)
+                    task.add_done_callback(self._running.discard)
+        finally:
+            for task in self._running:
+                task.cancel()
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def _poll(self, job: PollJob):
+        controller = job.home.controller
+        started = time.monotonic()
+        try:
+            async with self.limiter:
+                value = await controller.get(job.key)
+        except asyncio.CancelledError:
+            # Планировщик остановлен или перезапускается - задание возвращается в кучу,
+            # иначе этот ключ дома больше никогда не опросят
+            self._push(job, time.monotonic())
+            raise
+        except Exception as e:
+            logger.warning(f"[POLL] {job.home.id}/{job.key}: {e!r}")
+            value = None
+        elapsed = time.monotonic() - started
+        self.polls += 1
+        POLL_DURATION.observe((job.key,), elapsed)
+
+        job.interval = self._next_interval(job, value, elapsed)
+        changed = value != job.last_value
+        job.last_value = value
+        self._push(job, time.monotonic() + job.interval)
+
+        if value is not None or changed:
+            try:
+                await self.on_value(job.home, job.key, value)
+            except Exception as e:
+                logger.error(f"[POLL] Ошибка обработки {job.home.id}/{job.key}: {e!r}")
+
+    def _next_interval(self, job: PollJob, value, elapsed: float) -> float:
+        spec = job.spec
+        boosted = self._boost_until.get(job.home.id, 0) > time.monotonic()
+        unhealthy = value is None or elapsed > self.slow_threshold or job.home.controller.breaker.state != "closed"
+        if unhealthy:
+            interval = job.interval * self.backoff
+        elif value != job.last_value or boosted or not spec.idle_backoff:
+            interval = spec.interval
+        else:
+            interval = job.interval * self.backoff
+        if boosted and not unhealthy:
+            interval *= self.boost_factor
+        return min(max(interval, spec.interval * self.boost_factor), spec.max_interval)
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import time
+
+from controller import ControllerClient
+from models import ACTUATOR_TYPES, StateSnapshot
+
+
+logger = logging.getLogger(__name__)
+
+ACTUATORS = tuple(ACTUATOR_TYPES)
+
+
+# ---------- Тень устройства ----------
+# Для каждого исполнительного элемента хранятся два значения: desired - что
+# бот попросил выставить, reported - что последний раз сообщил контроллер.
+# Запись сразу меняет desired (оптимистично), поэтому меню и проверки состояния
+# отвечают из памяти. Фоновая сверка читает контроллер: после команд и
+# расхождений часто, при стабильном состоянии всё реже, до max_interval.
+class DeviceShadow:
+    def __init__(
+        self,
+        controller: ControllerClient,
+        *,
+        min_interval: float = 2,
+        max_interval: float = 60,
+        grace: float = 5,
+    ):
+        self.controller = controller
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.grace = grace
+        self.desired: dict[str, object] = {}
+        self.reported: dict[str, object] = {}
+        self.snapshot: StateSnapshot | None = None
+        self.reported_at = 0.0
+        self.interval = min_interval
+        self.drifts = 0
+        self.reconciles = 0
+        self._written_at: dict[str, float] = {}
+        self._wakeup = asyncio.Event()
+
+    # ---------- Чтение из памяти ----------
+    def get(self, key: str):
+        if key in self.desired:
+            return self.desired[key]
+        return self.reported.get(key)
+
+    # ---------- Оптимистичная запись ----------
+    async def set(self, key: str, value) -> bool:
+        self.desired[key] = value
+        self._written_at[key] = time.monotonic()
+        ok = await self.controller.write(key, value)
+        if ok:
+            self.reported[key] = value
+        elif self.desired.get(key) == value:
+            # Команда не дошла - откатываемся к тому, что сообщал контроллер
+            del self.desired[key]
+        # Сверка нужна скоро: подтвердить запись или заметить расхождение
+        self.interval = self.min_interval
+        self._wakeup.set()
+        return ok
+
+    # ---------- Сверка с контроллером ----------
+    async def reconcile(self) -> bool:
+        # Исполнительные элементы - мимо кэша: после записи там лежит то, что бот
+        # сам туда положил, а не то, что сообщил контроллер
+        snapshot = await self.controller.get_state_snapshot(fresh=ACTUATORS)
+        self.reconciles += 1
+        if snapshot.stale:
+            return False
+
+        now = time.monotonic()
+        changed = self.snapshot is None
+        for key in ACTUATORS:
+            actual = getattr(snapshot, key)
+            if self.reported.get(key) != actual:
+                changed = True
+            self.reported[key] = actual
+
+            if key not in self.desired:
+                continue
+            if self.desired[key] == actual:
+                del self.desired[key]
+            elif now - self._written_at.get(key, 0) > self.grace:
+                # Контроллер так и не принял команду или значение изменили в обход бота
+                self.drifts += 1
+                changed = True
+                logger.warning(
+                    f"[SHADOW] {self.controller.base_url}: {key} = {actual!r}, ожидалось {self.desired[key]!r}"
+                )
+                del self.desired[key]
+
+        # Датчики шумят на каждой сверке - интервал сбрасывают только исполнительные
+        # элементы (новое значение или расхождение)
+        self.snapshot = snapshot
+        self.reported_at = time.time()
+        return changed
+
+    async def run(self):
+        while True:
+            try:
+                changed = await self.reconcile()
+            except Exception as e:
+                logger.error(f"[SHADOW] Ошибка сверки {self.controller.base_url}: {e!r}")
+                changed = False
+
+            # Пока всё стабильно, сверяемся всё реже
+            self.interval = self.min_interval if changed else min(self.interval * 2, self.max_interval)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,164 @@
+import asyncio
+import contextlib
+import logging
+import sqlite3
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+import codec
+
+
+logger = logging.getLogger(__name__)
+
+# Запись FSM: (состояние, данные)
+Record = tuple[str | None, dict[str, Any]]
+
+EMPTY: Record = (None, {})
+
+
+# ---------- Хранилище FSM в SQLite ----------
+# Состояния переживают перезапуск бота. База открывается при первом обращении,
+# записи читаются по одной по мере надобности и оседают в LRU-кэше, а изменения
+# копятся и сбрасываются на диск одной транзакцией раз в flush_interval.
+class SQLiteStorage(BaseStorage):
+    def __init__(
+        self,
+        path: str,
+        *,
+        flush_interval: float = 0.5,
+        cache_size: int = 10000,
+        key_builder: KeyBuilder | None = None,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = asyncio.Lock()
+        self._cache: OrderedDict[str, Record] = OrderedDict()
+        self._dirty: dict[str, Record] = {}
+        self._flushing: dict[str, Record] = {}
+        self._flush_task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+        self._closing = asyncio.Event()
+
+    # ---------- Интерфейс BaseStorage ----------
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = self.key_builder.build(key)
+        _, data = await self._load(k)
+        self._store(k, (state.state if isinstance(state, State) else state, data))
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._load(self.key_builder.build(key)))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        k = self.key_builder.build(key)
+        state, _ = await self._load(k)
+        self._store(k, (state, dict(data)))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return dict((await self._load(self.key_builder.build(key)))[1])
+
+    async def close(self) -> None:
+        # Фоновый сброс не отменяем: посреди записи поток продолжил бы писать в
+        # базу, которую мы закрываем. Будим его и ждём, пока он допишет
+        self._closing.set()
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+        if self._db is not None:
+            await asyncio.to_thread(self._db.close)
+            self._db = None
+
+    # ---------- Кэш ----------
+    async def _load(self, k: str) -> Record:
+        record = self._dirty.get(k) or self._flushing.get(k)
+        if record is not None:
+            return record
+        record = self._cache.get(k)
+        if record is not None:
+            self._cache.move_to_end(k)
+            return record
+
+        db = await self._connect()
+        row = await asyncio.to_thread(self._select, db, k)
+        record = EMPTY if row is None else (row[0], codec.loads(row[1]))
+        self._remember(k, record)
+        return record
+
+    def _remember(self, k: str, record: Record):
+        if self.cache_size <= 0:
+            return
+        self._cache[k] = record
+        self._cache.move_to_end(k)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _store(self, k: str, record: Record):
+        self._remember(k, record)
+        self._dirty[k] = record
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    # ---------- Запись на диск ----------
+    async def _flush_later(self):
+        while self._dirty and not self._closing.is_set():
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._closing.wait(), self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        # Сбросы идут строго по одному, чтобы close() не обогнал запись в потоке
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+            self._flushing = dirty
+            try:
+                db = await self._connect()
+                await asyncio.to_thread(self._write, db, dirty)
+            except Exception as e:
+                logger.error(f"[FSM] Ошибка записи состояний: {e!r}")
+                # Не теряем изменения: вернём их в очередь, если их не перезаписали
+                for k, record in dirty.items():
+                    self._dirty.setdefault(k, record)
+            finally:
+                self._flushing = {}
+
+    async def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            async with self._db_lock:
+                if self._db is None:
+                    self._db = await asyncio.to_thread(self._open)
+        return self._db
+
+    def _open(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("CREATE TABLE IF NOT EXISTS fsm (key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL)")
+        db.commit()
+        return db
+
+    @staticmethod
+    def _select(db: sqlite3.Connection, k: str) -> tuple | None:
+        return db.execute("SELECT state, data FROM fsm WHERE key = ?", (k,)).fetchone()
+
+    @staticmethod
+    def _write(db: sqlite3.Connection, dirty: dict[str, Record]):
+        upserts = [(k, state, codec.dumps(data)) for k, (state, data) in dirty.items() if state is not None or data]
+        deletes = [(k,) for k, (state, data) in dirty.items() if state is None and not data]
+        with db:
+            if upserts:
+                db.executemany(
+                    "INSERT INTO fsm (key, state, data) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data",
+                    upserts,
+                )
+            if deletes:
+                db.executemany("DELETE FROM fsm WHERE key = ?", deletes)
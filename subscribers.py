@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import sqlite3
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Подписка на все категории оповещений
+ALL = "*"
+
+
+# ---------- Реестр подписчиков ----------
+# Чаты, их дом и настройки оповещений хранятся в SQLite и целиком держатся в памяти:
+# рассылка выбирает получателей по индексу (дом, категория) -> чаты, не трогая диск.
+#
+# shared=True - базу одновременно меняют несколько процессов: перед чтением
+# проверяется PRAGMA data_version, и при чужих изменениях реестр перечитывается.
+class SubscriberRegistry:
+    def __init__(self, path: str, default_home: str = "default", *, shared: bool = False):
+        self.path = path
+        self.default_home = default_home
+        self.shared = shared
+        self._data_version: int | None = None
+        self._db: sqlite3.Connection | None = None
+        self._lock = asyncio.Lock()
+        self._chats: dict[int, frozenset[str]] = {}
+        self._homes: dict[int, str] = {}
+        self._index: dict[tuple[str, str], set[int]] = {}
+
+    async def open(self):
+        self._db = await asyncio.to_thread(self._connect)
+        await asyncio.to_thread(self._reload)
+        logger.info(f"[SUBS] Загружено подписчиков: {len(self._chats)}")
+
+    def _reload(self):
+        self._data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        rows = self._db.execute("SELECT chat_id, home_id, alerts FROM subscribers").fetchall()
+        self._chats.clear()
+        self._homes.clear()
+        self._index.clear()
+        for chat_id, home_id, alerts in rows:
+            self._homes[chat_id] = home_id
+            self._remember(chat_id, frozenset(filter(None, alerts.split(","))))
+
+    def _refresh(self):
+        if not self.shared or self._db is None:
+            return
+        if self._db.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+            self._reload()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS subscribers ("
+            " chat_id INTEGER PRIMARY KEY,"
+            " home_id TEXT NOT NULL,"
+            " alerts TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        # Базы, созданные до появления нескольких домов, привязываем к дому по умолчанию
+        columns = {row[1] for row in db.execute("PRAGMA table_info(subscribers)")}
+        if "home_id" not in columns:
+            db.execute(f"ALTER TABLE subscribers ADD COLUMN home_id TEXT NOT NULL DEFAULT '{self.default_home}'")
+        db.commit()
+        return db
+
+    async def close(self):
+        if self._db is not None:
+            await asyncio.to_thread(self._db.close)
+            self._db = None
+
+    # ---------- Чтение ----------
+    def __contains__(self, chat_id: int) -> bool:
+        self._refresh()
+        return chat_id in self._chats
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._chats)
+
+    def categories(self, chat_id: int) -> frozenset[str]:
+        self._refresh()
+        return self._chats.get(chat_id, frozenset())
+
+    def wants(self, chat_id: int, category: str) -> bool:
+        self._refresh()
+        categories = self._chats.get(chat_id)
+        return categories is not None and (ALL in categories or category in categories)
+
+    def recipients(self, home_id: str, category: str) -> set[int]:
+        self._refresh()
+        return self._index.get((home_id, category), set()) | self._index.get((home_id, ALL), set())
+
+    def home_of(self, chat_id: int) -> str:
+        self._refresh()
+        return self._homes.get(chat_id, self.default_home)
+
+    def chats_of(self, home_id: str) -> list[int]:
+        self._refresh()
+        return [chat_id for chat_id, home in self._homes.items() if home == home_id]
+
+    # ---------- Изменение ----------
+    async def subscribe(self, chat_id: int, categories: frozenset[str] = frozenset({ALL})):
+        # Повторный /start не сбрасывает уже настроенные оповещения
+        if self._chats.get(chat_id):
+            return
+        await self.set_categories(chat_id, categories)
+
+    async def set_categories(self, chat_id: int, categories: frozenset[str]):
+        self._forget(chat_id)
+        self._remember(chat_id, categories)
+        await self._save(chat_id)
+
+    async def unsubscribe(self, chat_id: int):
+        # Привязка к дому остаётся, пропадают только оповещения
+        await self.set_categories(chat_id, frozenset())
+
+    async def bind_home(self, chat_id: int, home_id: str):
+        categories = self._chats.get(chat_id, frozenset({ALL}))
+        self._forget(chat_id)
+        self._homes[chat_id] = home_id
+        self._remember(chat_id, categories)
+        await self._save(chat_id)
+
+    async def _save(self, chat_id: int):
+        await self._write(
+            "INSERT INTO subscribers (chat_id, home_id, alerts, created_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(chat_id) DO UPDATE SET home_id = excluded.home_id, alerts = excluded.alerts",
+            (chat_id, self._homes.get(chat_id, self.default_home), ",".join(sorted(self._chats[chat_id])), time.time()),
+        )
+
+    async def _write(self, sql: str, params: tuple):
+        async with self._lock:
+            await asyncio.to_thread(self._execute, sql, params)
+
+    def _execute(self, sql: str, params: tuple):
+        with self._db:
+            self._db.execute(sql, params)
+
+    def _remember(self, chat_id: int, categories: frozenset[str]):
+        home_id = self._homes.get(chat_id, self.default_home)
+        self._chats[chat_id] = categories
+        for category in categories:
+            self._index.setdefault((home_id, category), set()).add(chat_id)
+
+    def _forget(self, chat_id: int):
+        home_id = self._homes.get(chat_id, self.default_home)
+        for category in self._chats.pop(chat_id, ()):
+            chats = self._index.get((home_id, category))
+            if chats is not None:
+                chats.discard(chat_id)
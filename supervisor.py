@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from resilience import backoff
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WorkerState:
+    name: str
+    factory: Callable[[], Awaitable]
+    status: str = "new"
+    restarts: int = 0
+    started_at: float = 0.0
+    last_error: str | None = None
+    task: asyncio.Task | None = None
+
+
+# ---------- Надзор за фоновыми задачами ----------
+# Каждый воркер - фабрика корутины. Упал или неожиданно завершился - через
+# паузу с экспоненциальным ростом (до restart_max) запускается заново; если
+# перед этим он проработал stable_after секунд, пауза снова минимальная.
+# Параллельно меряется задержка цикла событий: насколько позже положенного
+# просыпается sleep(lag_interval).
+class Supervisor:
+    def __init__(
+        self,
+        *,
+        restart_min: float = 1,
+        restart_max: float = 60,
+        stable_after: float = 60,
+        lag_interval: float = 1,
+        lag_warning: float = 0.5,
+    ):
+        self.restart_min = restart_min
+        self.restart_max = restart_max
+        self.stable_after = stable_after
+        self.lag_interval = lag_interval
+        self.lag_warning = lag_warning
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._workers: dict[str, WorkerState] = {}
+        self._lag_task: asyncio.Task | None = None
+
+    def add(self, name: str, factory: Callable[[], Awaitable]):
+        worker = WorkerState(name, factory)
+        self._workers[name] = worker
+        if self._lag_task is not None:
+            self._spawn(worker)
+
+    def start(self):
+        for worker in self._workers.values():
+            if worker.task is None:
+                self._spawn(worker)
+        self._lag_task = asyncio.create_task(self._watch_lag(), name="supervisor-lag")
+        logger.info(f"[SUPERVISOR] Запущено воркеров: {len(self._workers)}")
+
+    def _spawn(self, worker: WorkerState):
+        worker.task = asyncio.create_task(self._guard(worker), name=worker.name)
+
+    async def _guard(self, worker: WorkerState):
+        attempt = 0
+        while True:
+            worker.status = "running"
+            worker.started_at = time.monotonic()
+            try:
+                await worker.factory()
+                if asyncio.current_task().cancelling():
+                    # Воркер сам перехватил отмену и вышел - это штатная остановка
+                    worker.status = "stopped"
+                    return
+                worker.last_error = "завершился без ошибки"
+            except asyncio.CancelledError:
+                worker.status = "stopped"
+                raise
+            except Exception as e:
+                worker.last_error = repr(e)
+                logger.exception(f"[SUPERVISOR] Воркер {worker.name} упал")
+
+            if time.monotonic() - worker.started_at >= self.stable_after:
+                attempt = 0
+            delay = backoff(attempt, self.restart_min, self.restart_max)
+            attempt += 1
+            worker.restarts += 1
+            worker.status = "restarting"
+            logger.warning(f"[SUPERVISOR] Перезапуск {worker.name} через {delay:.1f} с")
+            await asyncio.sleep(delay)
+
+    async def _watch_lag(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.lag_interval)
+            self.lag = max(0.0, time.monotonic() - started - self.lag_interval)
+            self.max_lag = max(self.max_lag, self.lag)
+            if self.lag >= self.lag_warning:
+                logger.warning(f"[SUPERVISOR] Цикл событий отстаёт на {self.lag * 1000:.0f} мс")
+
+    # ---------- Состояние ----------
+    def health(self) -> dict:
+        now = time.monotonic()
+        return {
+            "loop_lag": self.lag,
+            "max_loop_lag": self.max_lag,
+            "workers": {
+                name: {
+                    "status": worker.status,
+                    "restarts": worker.restarts,
+                    "uptime": now - worker.started_at if worker.status == "running" else 0.0,
+                    "last_error": worker.last_error,
+                }
+                for name, worker in self._workers.items()
+            },
+        }
+
+    # ---------- Остановка ----------
+    async def stop(self, timeout: float = 10):
+        tasks = [worker.task for worker in self._workers.values() if worker.task is not None]
+        if self._lag_task is not None:
+            tasks.append(self._lag_task)
+            self._lag_task = None
+        for task in tasks:
+            task.cancel()
+        _, pending = await asyncio.wait(tasks, timeout=timeout) if tasks else (set(), set())
+        for task in pending:
+            logger.warning(f"[SUPERVISOR] Воркер {task.get_name()} не остановился за {timeout} с")
+        for worker in self._workers.values():
+            worker.task = None
+            worker.status = "stopped"
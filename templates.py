@@ -0,0 +1,67 @@
+from functools import lru_cache
+
+from models import StateSnapshot
+
+
+STALE_BANNER = "⚠️ Контроллер недоступен, показаны последние известные значения\n\n"
+
+
+# ---------- Текст состояния системы ----------
+# Один и тот же снимок рендерится много раз (панели, /state, проверки в ручном
+# режиме), поэтому готовый текст кэшируется по самому снимку: повтор стоит
+# одного хэша и не создаёт новых строк.
+@lru_cache(maxsize=1024)
+def render_state(snapshot: StateSnapshot) -> str:
+    text = (
+        "📟 Состояние системы:\n\n"
+        f"💨 Есть кто дома? - {'да' if snapshot.inside_presence else 'нет'}\n"
+        f"👣 Есть движение перед домом? - {'да' if snapshot.pir_motion else 'нет'}\n"
+        f"📏 Освещенность на улице - {snapshot.last_ldr}\n"
+        f"🪟 Уровень газа в доме - {snapshot.last_mq2}\n"
+        f"🔐 Температура на улице - {snapshot.last_temp}\n"
+        f"📏 Влажность на улице - {snapshot.last_hum}\n"
+        f"🪟 Цвет освещения (None - выключено) - {snapshot.led_color}\n"
+        f"🔐 Окно открыто? - {'да' if snapshot.window_open else 'нет'}\n"
+        f"🛠 Пищалка включена? - {'да' if snapshot.buzzer_active else 'нет'}\n"
+    )
+    return STALE_BANNER + text if snapshot.stale else text
+
+
+# ---------- Рекомендации одежды ----------
+# Совет зависит только от диапазона температуры и того, выше ли влажность 70%
+NO_WEATHER = "Не удалось получить температуру и влажность с контроллера. Попробуйте позже."
+
+ADVICE = {
+    ("cold", True): (
+        "Очень холодно и влажно. Рекомендую тёплую куртку, "
+        "водонепроницаемую обувь и головной убор. "
+        "Влажность повышена, охлаждение усиливается."
+    ),
+    ("cold", False): (
+        "Холодно, но влажность в норме. Возьми тёплую куртку "
+        "и перчатки. Основной фактор — низкая температура."
+    ),
+    ("cool", True): (
+        "Прохладно и влажно. Возьми лёгкую куртку. "
+        "Высокая влажность делает воздух холоднее ощущаемо."
+    ),
+    ("cool", False): (
+        "Прохладно, влажность нормальная. Подойдёт кофта или ветровка. "
+        "Условия комфортные."
+    ),
+    ("warm", True): (
+        "Тепло, но влажность повышена. Рекомендую лёгкую одежду, "
+        "дышащие ткани. Влажность делает воздух душным."
+    ),
+    ("warm", False): (
+        "Тепло и комфортно. Можно надевать обычную лёгкую одежду. "
+        "Показатели в норме."
+    ),
+}
+
+
+def render_recommendation(temp: int | float | None, hum: int | float | None) -> str:
+    if temp is None or hum is None:
+        return NO_WEATHER
+    band = "cold" if temp < 10 else "cool" if temp < 20 else "warm"
+    return f"🌡 Температура: {temp}°C\n💧 Влажность: {hum}%\n\n{ADVICE[band, hum > 70]}"
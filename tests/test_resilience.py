@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from controller import ControllerClient
+from resilience import ControllerUnavailable
+
+
+def failing(error: Exception):
+    async def request():
+        raise error
+    return request
+
+
+async def ok():
+    return "ok"
+
+
+def test_probe_error_does_not_wedge_half_open():
+    async def scenario():
+        client = ControllerClient("http://controller", breaker_threshold=1, breaker_reset=0)
+
+        with pytest.raises(ControllerUnavailable):
+            await client._call(failing(asyncio.TimeoutError()), retries=0)
+        assert client.breaker.state == "open"
+
+        # Пробный запрос получил не тот ответ (HTML вместо JSON)
+        with pytest.raises(ControllerUnavailable):
+            await client._call(failing(ValueError("not json")), retries=0)
+        assert client.breaker.state == "open"
+
+        # Контроллер ожил - следующий пробный запрос замыкает предохранитель
+        assert await client._call(ok, retries=0) == "ok"
+        assert client.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_probe_is_released():
+    async def scenario():
+        client = ControllerClient("http://controller", breaker_threshold=1, breaker_reset=0)
+        with pytest.raises(ControllerUnavailable):
+            await client._call(failing(asyncio.TimeoutError()), retries=0)
+
+        probe = asyncio.create_task(client._call(lambda: asyncio.sleep(10), retries=0))
+        await asyncio.sleep(0)
+        assert client.breaker.state == "half_open"
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert await client._call(ok, retries=0) == "ok"
+        assert client.breaker.state == "closed"
+
+    asyncio.run(scenario())
@@ -0,0 +1,49 @@
+import logging
+import multiprocessing
+from collections.abc import Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- Приложение для приёма вебхуков ----------
+# Обновления от Telegram приходят POST-запросом на path; заголовок
+# X-Telegram-Bot-Api-Secret-Token сверяется с secret, чужие запросы получают 401.
+def build_app(dp: Dispatcher, bot: Bot, *, path: str, secret: str | None) -> web.Application:
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def serve(app: web.Application, host: str, port: int, *, reuse_port: bool = False) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    # С SO_REUSEPORT несколько процессов слушают один порт, ядро делит между ними соединения
+    site = web.TCPSite(runner, host, port, reuse_port=reuse_port or None)
+    await site.start()
+    logger.info(f"[WEBHOOK] Приём обновлений на {host}:{port}")
+    return runner
+
+
+# ---------- Несколько процессов-обработчиков ----------
+def run_workers(count: int, target: Callable[[int], None]):
+    if count <= 1:
+        target(0)
+        return
+
+    workers = [multiprocessing.Process(target=target, args=(i,), name=f"webhook-{i}") for i in range(count)]
+    for worker in workers:
+        worker.start()
+    logger.info(f"[WEBHOOK] Запущено процессов: {count}")
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        # SIGINT уже получили все процессы группы, ждём их штатного завершения
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,63 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+
+@dataclass
+class PendingWrite:
+    value: object
+    waiters: list[asyncio.Future] = field(default_factory=list)
+
+
+# ---------- Пакетная запись исполнительных элементов ----------
+# Команды, пришедшие в течение window, уходят одним запросом. Повторная команда
+# тому же элементу заменяет ещё не отправленное значение, а её автор получает
+# результат той записи, которая в итоге ушла на контроллер.
+class WriteBatcher:
+    def __init__(self, send: Callable[[dict[str, object]], Awaitable[dict[str, bool]]], *, window: float = 0.05):
+        self.send = send
+        self.window = window
+        self.batches = 0
+        self.debounced = 0
+        self._pending: dict[str, PendingWrite] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    async def submit(self, key: str, value) -> bool:
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = PendingWrite(value, [future])
+        else:
+            pending.value = value
+            pending.waiters.append(future)
+            self.debounced += 1
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+        return await asyncio.shield(future)
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        self.batches += 1
+        try:
+            results = await self.send({key: write.value for key, write in batch.items()})
+        except Exception as e:
+            for write in batch.values():
+                for waiter in write.waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+            return
+
+        for key, write in batch.items():
+            for waiter in write.waiters:
+                if not waiter.done():
+                    waiter.set_result(results.get(key, False))